@@ -0,0 +1,182 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pywavefront
+
+# Bump when the layout of compiled meshes changes
+ASSET_VERSION = 4
+MESH_SUFFIX = '.mesh'
+MANIFEST_SUFFIX = '.mesh.json'
+# Interleaved uv, normal, position, the '2f 3f 3f' layout of every mesh VBO
+VERTEX_FORMAT = 'T2F_N3F_V3F'
+VERTEX_SIZE = 8
+POSITION_COLUMNS = slice(5, 8)
+# Columns of the position's y and z in a vertex, the axes wheels are centred on
+PIVOT_COLUMNS = slice(6, 8)
+# Camera distances past which the coarser levels of detail are drawn
+LOD_DISTANCES = (30, 80)
+# Clustering cell size per unit of switching distance, keeps the error to a few pixels when a level switches in
+LOD_ERROR = 0.003
+# Props spread over the whole track are split into square chunks of this size, each picking its own detail
+CHUNK_SIZE = 60
+CHUNKED_MATERIALS = {'objects/track.obj': ('Tree', 'Rock')}
+# Meshes the game loads, compiled by default
+GAME_OBJECTS = ['objects/podium.obj', 'objects/BMW.obj', 'objects/Mustang.obj', 'objects/track.obj']
+
+
+class MeshData:
+    def __init__(self, vertices, lods, pivot, bounds, chunks=()):
+        # Flat float32 vertices and one uint32 index list per level of detail, full detail first
+        self.vertices = vertices
+        self.lods = lods
+        self.indices = lods[0]
+        # The (y, z) centre of the bounding box and the bounding sphere as ((x, y, z), radius)
+        self.pivot = pivot
+        self.bounds = bounds
+        # Parts of a chunked mesh, drawing from the same vertices
+        self.chunks = chunks
+
+
+def get_asset_key(path):
+    stat = os.stat(path)
+    return {'version': ASSET_VERSION, 'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'format': VERTEX_FORMAT,
+            'lod_distances': list(LOD_DISTANCES), 'lod_error': LOD_ERROR, 'chunk_size': CHUNK_SIZE,
+            'chunked': list(CHUNKED_MATERIALS.get(path, ()))}
+
+
+def index_vertices(vertex_data):
+    # Unique interleaved vertices in order of first use, and the uint32 indices drawing the original triangles
+    vertices = np.asarray(vertex_data, dtype='f4').reshape(-1, VERTEX_SIZE)
+    unique, first, inverse = np.unique(vertices, axis=0, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    remap = np.empty(len(order), dtype='u4')
+    remap[order] = np.arange(len(order), dtype='u4')
+    return unique[order].ravel(), remap[inverse.ravel()]
+
+
+def get_pivot(vertices):
+    positions = vertices.reshape(-1, VERTEX_SIZE)[:, PIVOT_COLUMNS]
+    return ((positions.min(axis=0) + positions.max(axis=0)) / 2).tolist()
+
+
+def get_bounds(vertices, indices):
+    positions = vertices.reshape(-1, VERTEX_SIZE)[np.unique(indices), POSITION_COLUMNS]
+    center = (positions.min(axis=0) + positions.max(axis=0)) / 2
+    return center.tolist(), float(np.linalg.norm(positions - center, axis=1).max())
+
+
+def decimate(vertices, indices, cell_size):
+    # Vertex clustering, every vertex moves onto the first vertex of its grid cell and collapsed triangles are dropped
+    positions = vertices.reshape(-1, VERTEX_SIZE)[:, POSITION_COLUMNS]
+    cells = np.floor(positions / cell_size).astype(np.int64)
+    _, first, cluster = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+    triangles = first[cluster.ravel()][indices].reshape(-1, 3)
+    triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) &
+                          (triangles[:, 2] != triangles[:, 0])]
+    _, unique_rows = np.unique(triangles, axis=0, return_index=True)
+    return triangles[np.sort(unique_rows)].ravel().astype('u4')
+
+
+def get_lods(vertices, indices):
+    lods = [indices]
+    for distance in LOD_DISTANCES:
+        lods.append(decimate(vertices, indices, distance * LOD_ERROR))
+    return lods
+
+
+def split_chunks(vertices, indices):
+    # Triangles go to the chunk under their centroid, so no triangle is split or drawn twice
+    triangles = indices.reshape(-1, 3)
+    centroids = vertices.reshape(-1, VERTEX_SIZE)[:, POSITION_COLUMNS][triangles].mean(axis=1)
+    _, chunk = np.unique(np.floor(centroids[:, [0, 2]] / CHUNK_SIZE).astype(np.int64), axis=0, return_inverse=True)
+    chunk = chunk.ravel()
+    return [triangles[chunk == i].ravel() for i in range(chunk.max() + 1)]
+
+
+def build_meshes(path):
+    obj = pywavefront.Wavefront(path, cache=True, parse=True)
+    chunked = CHUNKED_MATERIALS.get(path, ())
+    meshes = {}
+    for name, material in obj.materials.items():
+        if material.vertex_format != VERTEX_FORMAT:
+            raise ValueError(f'Material {name} in {path} has vertex format {material.vertex_format}, '
+                             f'expected {VERTEX_FORMAT}')
+        vertices, indices = index_vertices(material.vertices)
+        chunks = []
+        if name in chunked:
+            chunks = [MeshData(vertices, get_lods(vertices, part), None, get_bounds(vertices, part))
+                      for part in split_chunks(vertices, indices)]
+        meshes[name] = MeshData(vertices, get_lods(vertices, indices), get_pivot(vertices),
+                                get_bounds(vertices, indices), chunks)
+    return meshes
+
+
+def compile_obj(path):
+    # Packs every material group of the .obj into one file of deduplicated float32 vertices, each followed by
+    # its uint32 index lists, and describes them in a small manifest
+    meshes = build_meshes(path)
+    materials = {}
+    offset = 0
+    with open(path + MESH_SUFFIX + '.tmp', 'wb') as file:
+        def write(data):
+            nonlocal offset
+            file.write(data.tobytes())
+            offset += len(data)
+            return [offset - len(data), len(data)]
+
+        def write_part(mesh):
+            return {'lods': [write(lod) for lod in mesh.lods], 'bounds': mesh.bounds}
+
+        for name, mesh in meshes.items():
+            materials[name] = {'vertices': write(mesh.vertices), 'pivot': mesh.pivot, **write_part(mesh),
+                               'chunks': [write_part(chunk) for chunk in mesh.chunks]}
+    os.replace(path + MESH_SUFFIX + '.tmp', path + MESH_SUFFIX)
+    # The manifest is written last so an interrupted compile never matches
+    with open(path + MANIFEST_SUFFIX + '.tmp', 'w') as file:
+        json.dump({'key': get_asset_key(path), 'materials': materials}, file)
+    os.replace(path + MANIFEST_SUFFIX + '.tmp', path + MANIFEST_SUFFIX)
+    return meshes
+
+
+def load_compiled(path):
+    try:
+        with open(path + MANIFEST_SUFFIX, 'r') as file:
+            manifest = json.load(file)
+        if manifest['key'] != get_asset_key(path):
+            return None
+        data = np.fromfile(path + MESH_SUFFIX, dtype='f4')
+    except (OSError, ValueError, KeyError):
+        return None
+    # Views into the one array read from disk, no copies, indices share the 4 byte words of the vertices
+    meshes = {}
+    for name, entry in manifest['materials'].items():
+        offset, count = entry['vertices']
+        vertices = data[offset:offset + count]
+        lods = [data[offset:offset + count].view('u4') for offset, count in entry['lods']]
+        chunks = [MeshData(vertices, [data[offset:offset + count].view('u4') for offset, count in chunk['lods']],
+                           None, chunk['bounds']) for chunk in entry['chunks']]
+        meshes[name] = MeshData(vertices, lods, entry['pivot'], entry['bounds'], chunks)
+    return meshes
+
+
+def load_obj(path):
+    # Material name to MeshData, compiling the .obj first when it is new or changed
+    meshes = load_compiled(path)
+    if meshes is None:
+        print(f'Compiling mesh - {path}')
+        try:
+            meshes = compile_obj(path)
+        except OSError as e:
+            print(f'Could not write compiled mesh - {e}')
+            meshes = build_meshes(path)
+    return meshes
+
+
+if __name__ == "__main__":
+    for obj_path in sys.argv[1:] or GAME_OBJECTS:
+        compiled = compile_obj(obj_path)
+        print(f'Compiled {obj_path} - {len(compiled)} materials, '
+              f'{sum(len(mesh.vertices) for mesh in compiled.values()) // VERTEX_SIZE} vertices, '
+              f'indices per level of detail {[sum(len(mesh.lods[lod]) for mesh in compiled.values()) for lod in range(len(LOD_DISTANCES) + 1)]}')
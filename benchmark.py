@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import time
+
+# Headless pygame, the display is only needed for surface conversions and nothing is shown
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import moderngl as mgl
+import numpy as np
+import pygame as pg
+
+import config
+from frame_pacing import FramePacer
+from main import GraphicsEngine
+from mesh import Mesh
+from profiler import Profiler, startup
+from replay import ReplayCatalogue
+from scene import TICK_DURATION
+from scene_manager import SceneManager
+from simulation import FIRST_RACE_TICK
+
+BENCHMARK_HISTORY = 'benchmarks.jsonl'
+# Scope names from SceneRenderer grouped into the reported stages
+STAGES = {'shadow': ('render_shadow',), 'main': ('main_render',),
+          'hud': ('Speedometer', 'Lap', 'StartSequence', 'Pause', 'LeaderBoard'), 'update': ('scene.update',)}
+PERCENTILES = (50, 95, 99)
+
+
+class HeadlessEngine(GraphicsEngine):
+    def __init__(self, win_size=(1920, 1080), backend=None):
+        with startup.phase('display'):
+            pg.init()
+            self.WIN_SIZE = win_size
+            pg.mixer.init()
+            pg.display.set_mode((1, 1))
+
+        self.ctx = mgl.create_context(standalone=True, require=330, **({'backend': backend} if backend else {}))
+        self.screen = self.ctx.framebuffer(color_attachments=[self.ctx.texture(win_size, 4)],
+                                           depth_attachment=self.ctx.depth_texture(win_size))
+        self.ctx.enable(flags=mgl.DEPTH_TEST | mgl.CULL_FACE)
+        self.ctx.enable(mgl.BLEND)
+        self.ctx.blend_func = mgl.SRC_ALPHA, mgl.ONE_MINUS_SRC_ALPHA
+        self.ctx.front_face = 'ccw'
+        self.running = True
+
+        # Every frame advances the simulation by exactly one tick
+        self.delta_time = TICK_DURATION
+        self.frame_pacer = FramePacer('uncapped')
+        self.profiler = Profiler(self.ctx)
+
+        with startup.phase('mesh'):
+            self.mesh = Mesh(self)
+
+        with startup.phase('scenes'):
+            self.scene_manager = SceneManager(self)
+
+    def render(self):
+        self.screen.clear(color=(0, 0, 0))
+        self.scene_manager.render()
+
+    def destroy(self):
+        self.mesh.destroy()
+        self.scene_manager.destroy()
+        self.screen.release()
+        self.ctx.release()
+        pg.quit()
+
+
+def get_stage_times(profiler):
+    # (frames, stages) cpu and gpu milliseconds, nan where a stage has no GPU query
+    names = list(STAGES)
+    cpu = np.zeros((len(profiler.frames), len(names)))
+    gpu = np.full((len(profiler.frames), len(names)), np.nan)
+    for row, (_, scopes) in enumerate(profiler.frames):
+        for name, start, end, gpu_ms in scopes:
+            for column, stage in enumerate(names):
+                if name in STAGES[stage]:
+                    cpu[row, column] += (end - start) * 1000
+                    if gpu_ms is not None:
+                        gpu[row, column] = np.nan_to_num(gpu[row, column]) + gpu_ms
+    return names, cpu, gpu
+
+
+def run_benchmark(win_size, replay, frames, warmup, backend=None):
+    app = HeadlessEngine(win_size, backend)
+    # The same opponents for every run, the player's car is the replay's own from its starting slot
+    random.seed(0)
+    app.scene_manager.scenes['RaceScene'].player_replay = replay
+    app.scene_manager.switch_scene('RaceScene')
+
+    for frame in range(warmup + frames):
+        if frame == warmup:
+            app.profiler.enabled = True
+        app.profiler.begin_frame()
+        app.scene_manager.current_scene.camera.update()
+        app.render()
+        app.ctx.finish()
+        app.profiler.end_frame()
+
+    names, cpu, gpu = get_stage_times(app.profiler)
+    app.destroy()
+    result = {}
+    for column, stage in enumerate(names):
+        result[stage] = {'cpu': dict(zip(map(str, PERCENTILES), np.percentile(cpu[:, column], PERCENTILES).tolist()))}
+        if not np.isnan(gpu[:, column]).all():
+            result[stage]['gpu'] = dict(zip(map(str, PERCENTILES),
+                                            np.nanpercentile(gpu[:, column], PERCENTILES).tolist()))
+    return result
+
+
+def run_startup_benchmark(win_size, runs, backend=None):
+    # Median seconds of every top level loading phase, and of the time until the first frame is drawn
+    startup.enable(trace_memory=False)
+    totals = []
+    for _ in range(runs):
+        startup.reset()
+        app = HeadlessEngine(win_size, backend)
+        with startup.phase('first frame'):
+            app.render()
+            app.ctx.finish()
+        run = startup.get_totals()
+        run['total'] = time.perf_counter() - startup.start
+        totals.append(run)
+        app.destroy()
+    return {name: float(np.median([run[name] for run in totals])) for name in totals[0]}
+
+
+def get_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(resolution, result):
+    print(resolution)
+    for stage, timings in result.items():
+        for kind, percentiles in timings.items():
+            values = '  '.join(f'p{p} {value:7.3f}' for p, value in percentiles.items())
+            print(f'  {stage:<8}{kind:<5}{values} ms')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render a replayed race offscreen and report frame-time percentiles')
+    parser.add_argument('--replay', default=None, help='replay driving the player car, the first finished one by default')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--warmup', type=int, default=FIRST_RACE_TICK, help='unmeasured frames, the intro by default')
+    parser.add_argument('--resolutions', nargs='*', default=None, help='WxH sizes, the resolutions option by default')
+    parser.add_argument('--backend', default=None, help='moderngl context backend, egl for machines without X')
+    parser.add_argument('--options', default='options.txt')
+    parser.add_argument('--output', default=BENCHMARK_HISTORY, help='file the results are appended to')
+    parser.add_argument('--startup', type=int, default=0, metavar='RUNS',
+                        help='time loading instead of rendering, repeated RUNS times at the first resolution')
+    args = parser.parse_args()
+
+    config.parse_options(args.options)
+    if args.startup:
+        resolution = (args.resolutions or config.global_variables['resolutions'])[0]
+        timings = run_startup_benchmark(tuple(int(size) for size in resolution.split('x')), args.startup, args.backend)
+        for name, seconds in timings.items():
+            print(f'{name:<16}{seconds * 1000:9.1f} ms')
+        with open(args.output, 'a') as file:
+            file.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': get_revision(),
+                                   'startup': timings, 'runs': args.startup}) + '\n')
+        raise SystemExit
+    catalogue = ReplayCatalogue()
+    name = args.replay or sorted(catalogue.get_finished(1))[0]
+    replay = catalogue.load(name)
+    resolutions = args.resolutions or config.global_variables['resolutions']
+
+    results = {}
+    for resolution in resolutions:
+        win_size = tuple(int(size) for size in resolution.split('x'))
+        results[resolution] = run_benchmark(win_size, replay, args.frames, args.warmup, args.backend)
+        print_result(resolution, results[resolution])
+
+    with open(args.output, 'a') as file:
+        file.write(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': get_revision(),
+                               'replay': name, 'frames': args.frames, 'results': results}) + '\n')
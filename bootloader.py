@@ -1,15 +1,15 @@
 import math
 import os
-import time
-from abc import abstractmethod
 
 import glm
-import pywavefront
 
 from model import *
 import random
-from scene import BasicScene
+from scene import BasicScene, TICK_DURATION
 from text_handler import generate_text_texture
+from replay import ReplayCatalogue, ReplayPlayer, ReplayRecorder, REPLAY_DIR
+from simulation import RaceSimulation, CAR_POSITIONS, START_ROTATION, TICK_RATE, get_physics_backend
+from track import TrackPath, TrackCursor, LapTracker
 from vbo import RectangleVBO
 from vehicle import Vehicle
 from custom_objects import *
@@ -17,16 +17,22 @@ import pygame as pg
 
 SPEED = 0.005
 TURN_SPEED = 0.01
-CAR_POSITIONS = [(23, 0.1, 29), (20.8, 0.1, 33), (17.5, 0.1, 25.9), (15.2, 0.1, 29.9)]
 
 
 class RaceScene(BasicScene):
     def __init__(self, scene_manager):
         super().__init__(scene_manager)
+        # Replay driving the player's car instead of the keyboard, set by the benchmark
+        self.player_replay = None
 
     def load(self):
-        self.main_car = Vehicle(self, int(config.global_variables['chosen_car'][0]), pos=CAR_POSITIONS[0], rot=(0, 1.05, 0),
-                                variant=config.global_variables['chosen_car'][1])
+        if self.player_replay is None:
+            self.main_car = Vehicle(self, int(config.global_variables['chosen_car'][0]), pos=CAR_POSITIONS[0],
+                                    rot=START_ROTATION, variant=config.global_variables['chosen_car'][1])
+        else:
+            # The recorded car from the slot it was recorded in, so it follows the recorded line
+            self.main_car = Vehicle(self, self.player_replay.car, pos=CAR_POSITIONS[self.player_replay.place],
+                                    rot=START_ROTATION)
         self.speedometer = Speedometer(self, self.main_car)
         self.lap = Lap(self)
         self.ss = StartSequence(self)
@@ -34,16 +40,11 @@ class RaceScene(BasicScene):
         self.game_starting = True
         self.game_ended = False
         self.times = {}
-        self.road_squares = []
-        self.visited = []
-        self.replays = [[], [], []]
-        self.enemy_controls = {}
         self.enemies = {}
         self.scripts = {}
         self.end_screen = False
         self.pause.hidden = True
         self.paused = False
-        self.paused_time = 0
 
         self.camera.position = glm.vec3(self.main_car.pos + (self.main_car.forward * 30))
         self.camera.position.y += 15
@@ -54,40 +55,21 @@ class RaceScene(BasicScene):
         self.camera.update()
         self.skybox = Skybox(self)
 
-        self.add_object(
+        self.add_static_object(
             ExtendedBaseModel(self, vao_name='cube', tex_id='grass', pos=(0, -0.01, 0), scale=(300, 0.001, 300),
                               tiling=200))
-        self.add_object(ExtendedBaseModel(self, vao_name='track', tex_id='asphalt', pos=(0, 0.1, 0), tiling=10))
-        self.add_object(ExtendedBaseModel(self, vao_name='markings', tex_id='markings'))
-        self.add_object(ExtendedBaseModel(self, vao_name='rail', tex_id='rail'))
-        self.add_object(ExtendedBaseModel(self, vao_name='finish', tex_id='finish'))
-        self.add_object(ExtendedBaseModel(self, vao_name='tree', tex_id='tree'))
-        self.add_object(ExtendedBaseModel(self, vao_name='rock', tex_id='rock'))
-
-        replays = os.listdir('replays')
-
-        for file_name in replays:
-            with open(f'replays/{file_name}', 'r') as file:
-                car = 0
-                place = 0
-                for i, line in enumerate(file):
-                    if i == 0:
-                        car = int(line)
-                    elif i == 1:
-                        place = int(line) - 1
-                        self.replays[place].append({'Car': car})
-                    elif '*' in line:
-                        speed = line.split(' ')
-                        self.replays[place][-1]['Speed'] = float(speed[1])
-                        self.replays[place][-1]['File'] = file_name
-                    else:
-                        tick, action = line.split(' ')
-                        tick = int(tick)
-                        action = int(action)
-                        if tick not in self.replays[place][-1]:
-                            self.replays[place][-1][tick] = [action]
-                        else:
-                            self.replays[place][-1][tick].append(action)
+        self.add_static_object(ExtendedBaseModel(self, vao_name='track', tex_id='asphalt', pos=(0, 0.1, 0), tiling=10))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='markings', tex_id='markings'))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='rail', tex_id='rail'))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='finish', tex_id='finish'))
+        self.add_chunked_object('tree', 'tree')
+        self.add_chunked_object('rock', 'rock')
+
+        self.track = TrackPath()
+        self.simulation = RaceSimulation(self.track, backend=get_physics_backend())
+        self.simulation.add_car(self.main_car, None if self.player_replay is None else ReplayPlayer(self.player_replay))
+        self.catalogue = ReplayCatalogue()
+        self.replays = [self.get_opponent_replays(place) for place in range(1, 4)]
         self.setup_cars()
         self.add_object(self.main_car)
         self.add_object(self.speedometer)
@@ -101,60 +83,27 @@ class RaceScene(BasicScene):
 
         self.speedometer.hidden = True
         self.lap.hidden = True
-        marks = []
-
-        with open('objects/Track_path.txt', 'r') as file:
-            for line in file:
-                if line.startswith('v'):
-                    _, x, y, z = line.split()
-                    point = [float(x), float(y), float(z)]
-                    marks.append(glm.vec3(point))
-
-        for i in range(len(marks) - 1):
-            corner1 = glm.vec3(-1, 0, -1)
-            corner2 = glm.vec3(-1, 0, 1)
-            corner3 = glm.vec3(1, 0, -1)
-            corner4 = glm.vec3(1, 0, 1)
-
-            m_model = glm.mat4(1.0)
-
-            translation_matrix = glm.translate(glm.mat4(1.0), marks[i])
-            m_model = m_model @ translation_matrix
-
-            direction = glm.normalize(marks[i + 1] - marks[i])
-            up_vector = glm.vec3(0, 1, 0)
-            right_vector = glm.cross(up_vector, direction)
-            rotation_matrix = glm.mat4(
-                glm.vec4(right_vector, 0),
-                glm.vec4(up_vector, 0),
-                glm.vec4(-direction, 0),
-                glm.vec4(0, 0, 0, 1)
-            )
-            m_model = m_model @ rotation_matrix
-
-            scaling_matrix = glm.scale(glm.mat4(1.0), glm.vec3(5, 1, 3))
-            m_model = m_model @ scaling_matrix
-
-            corner1 = glm.vec3(m_model * glm.vec4(corner1, 1))
-            corner2 = glm.vec3(m_model * glm.vec4(corner2, 1))
-            corner3 = glm.vec3(m_model * glm.vec4(corner3, 1))
-            corner4 = glm.vec3(m_model * glm.vec4(corner4, 1))
-            self.road_squares.append([corner1, corner2, corner3, corner4])
 
         pg.mixer.music.play()
 
-        self.start_time = time.time()
         self.starting_sequence()
 
+    def get_opponent_replays(self, place):
+        replays = self.catalogue.get_finished(place)
+        if self.player_replay is not None:
+            # The player's own replay is not raced against, unless it is the only one from its slot
+            replays = [name for name in replays if name != self.player_replay.name] or replays
+        return replays
+
     def setup_cars(self):
         for i in range(0, 3):
-            self.scripts[i + 1] = random.choice(self.replays[i])
-            car = Vehicle(self, int(self.scripts[i+1]['Car']), pos=CAR_POSITIONS[i + 1], rot=(0, 1.05, 0),
-                          variant=f"{random.randint(1,int(config.global_variables['cars'][config.global_variables['car_types'][int(self.scripts[i+1]['Car'])]]))}")
+            self.scripts[i + 1] = self.catalogue.load(random.choice(self.replays[i]))
+            car = Vehicle(self, self.scripts[i+1].car, pos=CAR_POSITIONS[i + 1], rot=START_ROTATION,
+                          variant=f"{random.randint(1,int(config.global_variables['cars'][config.global_variables['car_types'][self.scripts[i+1].car]]))}")
             self.enemies[i + 1] = car
             self.add_object(car)
-            self.enemy_controls[i + 1] = [False] * 4
-            self.times[f'Player {i + 2}'] = float(self.scripts[i + 1]['Speed'])
+            self.simulation.add_car(car, ReplayPlayer(self.scripts[i + 1]))
+            self.times[f'Player {i + 2}'] = self.scripts[i + 1].finish_time
 
     def starting_sequence(self):
         if self.tick % 82 == 0:
@@ -192,24 +141,8 @@ class RaceScene(BasicScene):
             self.controls()
             return
 
-        self.update_enemies()
-
         if not self.game_ended:
             self.controls()
-            inside = False
-            for e, i in enumerate(self.road_squares):
-                if self.is_player_inside_squares(self.main_car.pos, i):
-                    if e not in self.visited:
-                        self.visited.append(e)
-                    if e == 17:
-                        self.check_lap()
-                    inside = True
-
-                    break
-            if not inside:
-                self.main_car.on_road = False
-            else:
-                self.main_car.on_road = True
         else:
             keys = pg.key.get_pressed()
             if keys[pg.K_SPACE]:
@@ -217,46 +150,26 @@ class RaceScene(BasicScene):
                 self.scene_manager.switch_scene('MainMenuScene')
             self.main_car.hit_brake()
             if not self.end_screen:
-                end_time = time.time() - self.paused_time
-                self.times['You'] = end_time - self.start_time
+                # Paused ticks are not counted, so neither is the time spent in the pause menu
+                self.times['You'] = self.simulation.get_finish_times()[0]
                 self.add_object(LeaderBoard(self, self.times))
                 self.speedometer.hidden = True
                 self.lap.hidden = True
                 self.end_screen = True
 
+        # Moves every car, the player's controls were applied above
+        self.simulation.step(self.tick)
+        self.lap.lap = self.simulation.lap_trackers[0].lap
+        if self.simulation.lap_trackers[0].finished:
+            self.game_ended = True
+
         self.camera.position += ((self.main_car.pos - (self.main_car.forward * 3)) - self.camera.position) * 0.2
         self.camera.position.y = self.main_car.pos.y + 2
         self.camera.forward = glm.vec3(self.main_car.forward)
         self.camera.up = glm.vec3(self.main_car.up)
         self.camera.side = glm.vec3(self.main_car.side)
 
-        self.main_car.update_pos()
-
-    def update_enemies(self):
-
-        for e, c in self.enemies.items():
-            if self.tick in self.scripts[e]:
-                if 0 in self.scripts[e][self.tick]:
-                    self.enemy_controls[e][0] = not self.enemy_controls[e][0]
-                if 1 in self.scripts[e][self.tick]:
-                    self.enemy_controls[e][1] = not self.enemy_controls[e][1]
-                if 2 in self.scripts[e][self.tick]:
-                    self.enemy_controls[e][2] = not self.enemy_controls[e][2]
-                if 3 in self.scripts[e][self.tick]:
-                    self.enemy_controls[e][3] = not self.enemy_controls[e][3]
-            if self.enemy_controls[e][0]:
-                c.accelerate()
-            if self.enemy_controls[e][1]:
-                c.hit_brake()
-            if self.enemy_controls[e][2]:
-                c.rotate(True)
-            if self.enemy_controls[e][3]:
-                c.rotate(False)
-            c.update_pos()
-
-
     def pause_scene(self):
-        self.paused_clock = time.time()
         self.paused = True
         self.pause.hidden = False
         self.speedometer.hidden = True
@@ -264,7 +177,6 @@ class RaceScene(BasicScene):
         pg.mixer.music.pause()
 
     def unpause_scene(self):
-        self.paused_time += time.time() - self.paused_clock
         self.paused = False
         self.pause.hidden = True
         self.speedometer.hidden = False
@@ -297,33 +209,14 @@ class RaceScene(BasicScene):
                     self.scene_manager.switch_scene('MainMenuScene')
 
 
-    def check_lap(self):
-        if len(self.visited) >= len(self.road_squares) * 80 / 100:
-            self.lap.lap += 1
-            self.visited.clear()
-            if self.lap.lap == 3:
-                self.game_ended = True
-
-    @abstractmethod
-    def is_player_inside_squares(self, player_pos, transformed_corners):
-        corner1, corner2, corner3, corner4 = transformed_corners
-        if (
-                min(corner1.x, corner2.x, corner3.x, corner4.x) <= player_pos.x <= max(corner1.x, corner2.x, corner3.x,
-                                                                                       corner4.x)
-                and min(corner1.z, corner2.z, corner3.z, corner4.z) <= player_pos.z <= max(corner1.z, corner2.z,
-                                                                                           corner3.z, corner4.z)
-        ):
-            return True
-        return False
-
-
 class RecordScene(BasicScene):
     def __init__(self, scene_manager):
         super().__init__(scene_manager)
+        self.recorder = None
 
     def load(self):
         self.car_pos = random.randint(1, 3)
-        self.main_car = Vehicle(self, 1, pos=CAR_POSITIONS[self.car_pos], rot=(0, 1.05, 0))
+        self.main_car = Vehicle(self, 1, pos=CAR_POSITIONS[self.car_pos], rot=START_ROTATION)
         self.speedometer = Speedometer(self, self.main_car)
         self.lap = Lap(self)
         self.ss = StartSequence(self)
@@ -332,11 +225,10 @@ class RecordScene(BasicScene):
         self.game_ended = False
         self.movements = {}
         self.times = {}
-        self.road_squares = []
-        self.visited = []
-        self.replays = os.listdir('replays/')
+        self.replays = os.listdir(REPLAY_DIR)
         self.keys = [False, False, False, False]
         self.recorded = False
+        self.finish_tick = None
 
         self.camera.position = glm.vec3(self.main_car.pos + (self.main_car.forward * 30))
         self.camera.position.y += 15
@@ -347,15 +239,15 @@ class RecordScene(BasicScene):
         self.camera.update()
         self.skybox = Skybox(self)
 
-        self.add_object(
+        self.add_static_object(
             ExtendedBaseModel(self, vao_name='cube', tex_id='grass', pos=(0, -0.01, 0), scale=(300, 0.001, 300),
                               tiling=200))
-        self.add_object(ExtendedBaseModel(self, vao_name='track', tex_id='asphalt', pos=(0, 0.1, 0), tiling=10))
-        self.add_object(ExtendedBaseModel(self, vao_name='markings', tex_id='markings'))
-        self.add_object(ExtendedBaseModel(self, vao_name='rail', tex_id='rail'))
-        self.add_object(ExtendedBaseModel(self, vao_name='finish', tex_id='finish'))
-        self.add_object(ExtendedBaseModel(self, vao_name='tree', tex_id='tree'))
-        self.add_object(ExtendedBaseModel(self, vao_name='rock', tex_id='rock'))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='track', tex_id='asphalt', pos=(0, 0.1, 0), tiling=10))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='markings', tex_id='markings'))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='rail', tex_id='rail'))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='finish', tex_id='finish'))
+        self.add_chunked_object('tree', 'tree')
+        self.add_chunked_object('rock', 'rock')
 
         self.add_object(self.main_car)
         self.add_object(self.speedometer)
@@ -363,54 +255,16 @@ class RecordScene(BasicScene):
         self.add_object(self.ss)
         # pg.mixer.music.load("audio/running_downwards_(bmw's_theme).mp3")
 
-        self.start_time = time.time()
-
         self.speedometer.hidden = True
         self.lap.hidden = True
 
-        objs = pywavefront.Wavefront(f'objects/track.obj', cache=True, parse=True)
-        marks = []
-
-        with open('objects/Track_path.txt', 'r') as file:
-            for line in file:
-                if line.startswith('v'):
-                    _, x, y, z = line.split()
-                    point = [float(x), float(y), float(z)]
-                    marks.append(glm.vec3(point))
-
-        with open(f'replays/record_{len(self.replays)}', 'a') as file:
-            file.write(f"1\n{self.car_pos}\n")
-
-        for i in range(len(marks) - 1):
-            corner1 = glm.vec3(-1, 0, -1)
-            corner2 = glm.vec3(-1, 0, 1)
-            corner3 = glm.vec3(1, 0, -1)
-            corner4 = glm.vec3(1, 0, 1)
-
-            m_model = glm.mat4(1.0)
-
-            translation_matrix = glm.translate(glm.mat4(1.0), marks[i])
-            m_model = m_model @ translation_matrix
-
-            direction = glm.normalize(marks[i + 1] - marks[i])
-            up_vector = glm.vec3(0, 1, 0)
-            right_vector = glm.cross(up_vector, direction)
-            rotation_matrix = glm.mat4(
-                glm.vec4(right_vector, 0),
-                glm.vec4(up_vector, 0),
-                glm.vec4(-direction, 0),
-                glm.vec4(0, 0, 0, 1)
-            )
-            m_model = m_model @ rotation_matrix
-
-            scaling_matrix = glm.scale(glm.mat4(1.0), glm.vec3(5, 1, 3))
-            m_model = m_model @ scaling_matrix
-
-            corner1 = glm.vec3(m_model * glm.vec4(corner1, 1))
-            corner2 = glm.vec3(m_model * glm.vec4(corner2, 1))
-            corner3 = glm.vec3(m_model * glm.vec4(corner3, 1))
-            corner4 = glm.vec3(m_model * glm.vec4(corner4, 1))
-            self.road_squares.append([corner1, corner2, corner3, corner4])
+        self.track = TrackPath()
+
+        self.recorder = ReplayRecorder(os.path.join(REPLAY_DIR, f'record_{len(self.replays)}'), self.main_car.id,
+                                       self.car_pos)
+
+        self.track_cursor = TrackCursor(self.track)
+        self.lap_tracker = LapTracker(self.track)
 
         self.starting_sequence()
 
@@ -449,31 +303,23 @@ class RecordScene(BasicScene):
         if not self.game_ended:
             self.controls()
 
-            inside = False
-            for e, i in enumerate(self.road_squares):
-                if self.is_player_inside_squares(self.main_car.pos, i):
-                    if e not in self.visited:
-                        self.visited.append(e)
-                    if e == 17:
-                        self.check_lap()
-                    inside = True
-
-                    break
-            if not inside:
-                self.main_car.on_road = False
-            else:
-                self.main_car.on_road = True
+            segment = self.track_cursor.update(self.main_car.pos)
+            if self.lap_tracker.update(segment):
+                self.lap.lap = self.lap_tracker.lap
+                self.game_ended = self.lap_tracker.finished
+                if self.game_ended:
+                    self.finish_tick = self.tick
+            self.main_car.on_road = segment is not None
         else:
-            end_time = time.time()
-            time_total = end_time - self.start_time
+            # Counted in ticks so the time matches a replay of the same run at any frame rate
+            time_total = self.finish_tick / TICK_RATE
             self.times['You'] = time_total
             self.add_object(LeaderBoard(self, self.times))
             self.main_car.hit_brake()
             self.speedometer.hidden = True
             self.lap.hidden = True
             if not self.recorded:
-                with open(f'replays/record_{len(self.replays)}', 'a') as file:
-                    file.write(f"* {time_total}")
+                self.recorder.finish(time_total)
                 self.recorded = True
 
         if not self.free_cam:
@@ -491,45 +337,45 @@ class RecordScene(BasicScene):
             self.main_car.accelerate()
             if not self.keys[0]:
                 self.keys[0] = not self.keys[0]
-                self.record_action('0')
+                self.record_action(0)
         elif self.keys[0]:
             self.keys[0] = not self.keys[0]
-            self.record_action('0')
+            self.record_action(0)
 
         if keys[pg.K_s]:
             self.main_car.hit_brake()
             if not self.keys[1]:
                 self.keys[1] = not self.keys[1]
-                self.record_action('1')
+                self.record_action(1)
         elif self.keys[1]:
             self.keys[1] = not self.keys[1]
-            self.record_action('1')
+            self.record_action(1)
 
         if keys[pg.K_a]:
             self.main_car.rotate(True)
             if not self.keys[2]:
                 self.keys[2] = not self.keys[2]
-                self.record_action('2')
+                self.record_action(2)
         elif self.keys[2]:
             self.keys[2] = not self.keys[2]
-            self.record_action('2')
+            self.record_action(2)
 
         if keys[pg.K_d]:
             self.main_car.rotate(False)
             if not self.keys[3]:
                 self.keys[3] = not self.keys[3]
-                self.record_action('3')
+                self.record_action(3)
         elif self.keys[3]:
             self.keys[3] = not self.keys[3]
-            self.record_action('3')
+            self.record_action(3)
 
         if keys[pg.K_o]:
             self.free_cam = not self.free_cam
             self.speedometer.hidden = not self.speedometer.hidden
             self.lap.hidden = not self.lap.hidden
 
-        velocity = SPEED * self.app.delta_time
-        velocity_r = TURN_SPEED * self.app.delta_time
+        velocity = SPEED * TICK_DURATION
+        velocity_r = TURN_SPEED * TICK_DURATION
 
         if keys[pg.K_RIGHT]:
             self.camera.yaw += 10 * velocity_r
@@ -554,28 +400,13 @@ class RecordScene(BasicScene):
             if keys[pg.K_k]:
                 self.camera.position += self.camera.side * velocity
 
-    def check_lap(self):
-        if len(self.visited) >= len(self.road_squares) * 80 / 100:
-            self.lap.lap += 1
-            self.visited.clear()
-            if self.lap.lap == 3:
-                self.game_ended = True
-
-    @staticmethod
-    def is_player_inside_squares(player_pos, transformed_corners):
-        corner1, corner2, corner3, corner4 = transformed_corners
-        if (
-                min(corner1.x, corner2.x, corner3.x, corner4.x) <= player_pos.x <= max(corner1.x, corner2.x, corner3.x,
-                                                                                       corner4.x)
-                and min(corner1.z, corner2.z, corner3.z, corner4.z) <= player_pos.z <= max(corner1.z, corner2.z,
-                                                                                           corner3.z, corner4.z)
-        ):
-            return True
-        return False
-
     def record_action(self, action):
-        with open(f'replays/record_{len(self.replays)}', 'a') as file:
-            file.write(f"{self.tick} {action}\n")
+        self.recorder.record(self.tick, action)
+
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
 
 
 class MainMenuScene(BasicScene):
@@ -590,15 +421,15 @@ class MainMenuScene(BasicScene):
         self.camera.update()
         self.in_options = False
 
-        self.add_object(
+        self.add_static_object(
             ExtendedBaseModel(self, vao_name='cube', tex_id='grass', pos=(0, -0.01, 0), scale=(300, 0.001, 300),
                               tiling=200))
-        self.add_object(ExtendedBaseModel(self, vao_name='track', tex_id='asphalt', pos=(0, 0.1, 0), tiling=10))
-        self.add_object(ExtendedBaseModel(self, vao_name='markings', tex_id='markings'))
-        self.add_object(ExtendedBaseModel(self, vao_name='rail', tex_id='rail'))
-        self.add_object(ExtendedBaseModel(self, vao_name='finish', tex_id='finish'))
-        self.add_object(ExtendedBaseModel(self, vao_name='tree', tex_id='tree'))
-        self.add_object(ExtendedBaseModel(self, vao_name='rock', tex_id='rock'))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='track', tex_id='asphalt', pos=(0, 0.1, 0), tiling=10))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='markings', tex_id='markings'))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='rail', tex_id='rail'))
+        self.add_static_object(ExtendedBaseModel(self, vao_name='finish', tex_id='finish'))
+        self.add_chunked_object('tree', 'tree')
+        self.add_chunked_object('rock', 'rock')
         self.skybox = Skybox(self)
 
         pg.mixer.music.load("audio/calm_before_the_storm_(main_menu).mp3")
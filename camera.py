@@ -5,6 +5,20 @@ NEAR = 0.1
 FAR = 1000
 
 
+def get_frustum_planes(m_view_proj):
+    # Gribb-Hartmann extraction, every plane as (normal, distance) with the normal pointing into the frustum
+    rows = [glm.row(m_view_proj, i) for i in range(4)]
+    planes = [rows[3] + rows[0], rows[3] - rows[0], rows[3] + rows[1], rows[3] - rows[1], rows[3] + rows[2],
+              rows[3] - rows[2]]
+    return [plane / glm.length(glm.vec3(plane)) for plane in planes]
+
+
+def sphere_in_frustum(planes, center, radius):
+    for plane in planes:
+        if glm.dot(glm.vec3(plane), center) + plane.w < -radius:
+            return False
+    return True
+
 
 class Camera:
     def __init__(self, app, position=(0, 0, 0), yaw=0, pitch=0):
@@ -20,6 +34,7 @@ class Camera:
         self.update_rotation()
         self.m_view = self.get_view_matrix()
         self.m_proj = self.get_projection_matrix()
+        self.save_state()
 
     def update(self):
         self.m_view = self.get_view_matrix()
@@ -36,6 +51,19 @@ class Camera:
         self.side = glm.normalize(glm.cross(self.forward, glm.vec3(0, 1, 0)))
         self.up = glm.normalize(glm.cross(self.side, self.forward))
 
+    def save_state(self):
+        self.previous_state = (glm.vec3(self.position), glm.vec3(self.forward), glm.vec3(self.up))
+
+    def interpolate(self, alpha):
+        # View from between the last two simulation ticks
+        position, forward, up = self.previous_state
+        position = glm.mix(position, self.position, alpha)
+        self.m_view = glm.lookAt(position, position + glm.mix(forward, self.forward, alpha), glm.mix(up, self.up, alpha))
+        self.m_proj = self.get_projection_matrix()
+
+    def get_frustum_planes(self):
+        return get_frustum_planes(self.m_proj * self.m_view)
+
     def get_projection_matrix(self):
         return glm.perspective(glm.radians(self.fov), self.aspect_ratio, NEAR, FAR)
 
@@ -2,7 +2,7 @@ import glm
 
 import config
 from model import ExtendedBaseModelBody, ExtendedBaseModelWheel, BasicImage, ImagePlusModel
-from text_handler import generate_text_texture
+from text_handler import generate_text_texture, generate_text_block_texture
 from vbo import RectangleVBO
 import pygame as pg
 from collections import OrderedDict
@@ -18,20 +18,24 @@ class VehicleModel:
         self.rotation = glm.vec3(rot)
         self.wheel_rotation = 0
         self.variant = variant
-        self.body = ExtendedBaseModelBody(scene, self.name, self.name + '_' + self.variant, pos, rot,
-                                          scale=scale, tiling=1)
+        # Cars are drawn instanced, the skin is a layer of the model's texture array
+        self.batch = self.app.mesh.vehicle_batches[self.name]
+        self.body = ExtendedBaseModelBody(scene, self.name, None, pos, rot, scale=scale, tiling=1,
+                                          texture=self.batch.skins)
         self.front_tires = ExtendedBaseModelWheel(scene, self.name + '_front', self.name + '_wheels', pos=(0, 0, 0),
                                                   rot=(0, 0, 0), scale=(1, 1, 1), car=self, tiling=1)
         self.back_tires = ExtendedBaseModelWheel(scene, self.name + '_back', self.name + '_wheels', pos=(0, 0, 0),
                                                  rot=(0, 0, 0), scale=(1, 1, 1), car=self, tiling=1)
 
     def render_shadow(self):
-        self.body.render_shadow()
+        self.batch.render_shadow([self])
+
+    def is_visible(self, planes):
+        # The wheels stay inside the body's bounds
+        return self.body.is_visible(planes)
 
     def render(self):
-        self.body.render()
-        self.front_tires.render()
-        self.back_tires.render()
+        self.batch.render([self])
 
     def move_wheel_rotation(self, rot):
         self.wheel_rotation = self.wheel_rotation + rot
@@ -42,9 +46,6 @@ class VehicleModel:
         self.body.rotation = self.rotation
         self.front_tires.rotation = rotation_w
         self.back_tires.rotation = rotation_w
-        self.body.m_model = self.body.get_model_matrix()
-        self.front_tires.m_model = self.front_tires.get_model_matrix()
-        self.back_tires.m_model = self.back_tires.get_model_matrix()
 
     def set_pos(self, pos):
         self.pos = glm.vec3(pos)
@@ -52,6 +53,17 @@ class VehicleModel:
         self.front_tires.pos = pos
         self.back_tires.pos = pos
 
+    def place_models(self, pos, rotation, wheel_rotation):
+        # Moves only what is drawn, the car keeps its own pos and rotation
+        rotation_w = glm.vec3(rotation)
+        rotation_w.x += wheel_rotation
+        self.body.pos = pos
+        self.front_tires.pos = pos
+        self.back_tires.pos = pos
+        self.body.rotation = rotation
+        self.front_tires.rotation = rotation_w
+        self.back_tires.rotation = rotation_w
+
 
 class Speedometer:
     def __init__(self, scene, car):
@@ -312,6 +324,58 @@ class StartSequence:
         self.state += 1
 
 
+class ProfilerOverlay:
+    def __init__(self, app, profiler, refresh_interval=30):
+        self.app = app
+        self.profiler = profiler
+        # Frames between rebuilding the text, which is itself too slow to do every frame
+        self.refresh_interval = refresh_interval
+        self.frame = 0
+        self.hidden = False
+
+        initial_size = [640, 360]
+        current_size = self.app.WIN_SIZE
+        self.scaling_factor = current_size[0] / initial_size[0]
+        self.font = pg.font.SysFont('monospace', int(8 * self.scaling_factor))
+        self.text_obj = None
+
+    def refresh(self):
+        lines = [f'{"scope":<16}{"cpu ms":>8}{"gpu ms":>8}']
+        for name, (cpu, gpu) in self.profiler.get_averages().items():
+            lines.append(f'{name:<16}{cpu:8.2f}{"" if gpu is None else f"{gpu:8.2f}"}')
+        stats = self.app.frame_pacer.get_stats()
+        if stats:
+            lines.append(f'{stats["fps"]:.0f} fps  p99 {stats["p99"]:.2f} ms')
+        queue = self.app.scene_manager.scene_renderer.queue
+        lines.append(f'{queue.draws} draws  {queue.program_changes} programs  '
+                     f'{queue.texture_changes} textures')
+        self.release()
+        text, size = generate_text_block_texture(self.app.ctx, lines, self.font, color=(255, 255, 0),
+                                                 background=(0, 0, 0, 255))
+        rec = RectangleVBO(self.app.ctx, size=size)
+        vao = self.app.ctx.vertex_array(self.app.mesh.vao.program.programs['image'],
+                                        [(rec.vbo, rec.format, *rec.attrib)], skip_errors=True)
+        self.text_obj = BasicImage(self, vao, 'None', pos=(size[0] / 2 + 4 * self.scaling_factor,
+                                                           self.app.WIN_SIZE[1] - size[1] / 2 - 4 * self.scaling_factor),
+                                   texture=text)
+        self.text_obj.vbo = rec.vbo
+
+    def render(self):
+        if self.hidden:
+            return
+        if self.text_obj is None or self.frame % self.refresh_interval == 0:
+            self.refresh()
+        self.frame += 1
+        self.text_obj.render()
+
+    def release(self):
+        if self.text_obj is not None:
+            self.text_obj.texture.release()
+            self.text_obj.vao.release()
+            self.text_obj.vbo.release()
+            self.text_obj = None
+
+
 class MainMenu:
     def __init__(self, scene, scene_manager):
         self.scene = scene
@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+import pygame as pg
+
+import config
+
+PACING_MODES = ('uncapped', 'capped', 'vsync', 'hybrid')
+# The hybrid limiter sleeps until this close to the deadline and spins for the rest
+SPIN_MARGIN = 0.002
+# Frames kept for the statistics
+STATS_WINDOW = 600
+# Swap intervals asked of the driver in vsync mode, adaptive first, and the pacing used when it refuses both
+VSYNC_INTERVALS = (-1, 1)
+VSYNC_FALLBACK = 'capped'
+
+
+def get_pacing_options():
+    mode = config.global_variables['frame_pacings'][int(config.global_variables['frame_pacing'][0])]
+    cap = int(config.global_variables['frame_caps'][int(config.global_variables['frame_cap'][0])])
+    return mode, cap
+
+
+class FramePacer:
+    def __init__(self, mode='capped', cap=60):
+        if mode not in PACING_MODES:
+            raise ValueError(f'Unknown frame pacing mode {mode}')
+        # The mode asked for, and the one in effect once the display is open
+        self.requested_mode = mode
+        self.mode = mode
+        # Swap interval the display was opened with, None without vsync
+        self.vsync = None
+        self.cap = cap
+        self.frame_duration = 1 / cap
+        self.clock = pg.time.Clock()
+        self.last_frame = time.perf_counter()
+        # Ring buffer of frame times in milliseconds
+        self.frame_times = np.zeros(STATS_WINDOW)
+        self.frame_count = 0
+
+    def set_display_mode(self, size, flags):
+        # Opens the window, falling back from adaptive to regular vsync and then to capped pacing
+        if self.mode == 'vsync':
+            for interval in VSYNC_INTERVALS:
+                try:
+                    screen = pg.display.set_mode(size, flags=flags, vsync=interval)
+                    self.vsync = interval
+                    return screen
+                except pg.error as e:
+                    print(f'Could not enable vsync {interval} - {e}')
+            self.mode = VSYNC_FALLBACK
+        return pg.display.set_mode(size, flags=flags)
+
+    def wait(self):
+        # Blocks until the next frame may start and returns the frame time in milliseconds
+        if self.mode == 'capped':
+            self.clock.tick(self.cap)
+        elif self.mode == 'hybrid':
+            deadline = self.last_frame + self.frame_duration
+            remaining = deadline - time.perf_counter()
+            if remaining > SPIN_MARGIN:
+                time.sleep(remaining - SPIN_MARGIN)
+            while time.perf_counter() < deadline:
+                pass
+        # Uncapped and vsync frames are paced by the display flip, if at all
+
+        now = time.perf_counter()
+        delta_time = (now - self.last_frame) * 1000
+        self.last_frame = now
+        self.frame_times[self.frame_count % STATS_WINDOW] = delta_time
+        self.frame_count += 1
+        return delta_time
+
+    def get_stats(self):
+        frame_times = self.frame_times[:min(self.frame_count, STATS_WINDOW)]
+        if not len(frame_times):
+            return {}
+        average = frame_times.mean()
+        return {'mode': self.mode, 'vsync': self.vsync, 'fps': 1000 / average, 'average': average, 'p99': np.percentile(frame_times, 99),
+                'max': frame_times.max(), 'jitter': frame_times.std()}
+
+    def print_stats(self):
+        stats = self.get_stats()
+        if stats:
+            mode = self.mode if self.mode == self.requested_mode else f'{self.mode} (asked for {self.requested_mode})'
+            if self.vsync is not None:
+                mode += f', {"adaptive " if self.vsync == -1 else ""}vsync'
+            print(f'Frame pacing - {mode} {stats["fps"]:.1f} fps, avg {stats["average"]:.2f} ms, '
+                  f'p99 {stats["p99"]:.2f} ms, max {stats["max"]:.2f} ms, jitter {stats["jitter"]:.2f} ms')
@@ -0,0 +1,72 @@
+import glm
+import numpy as np
+
+from vbo import MAX_INSTANCES, INSTANCE_SIZE
+
+
+class VehicleBatch:
+    def __init__(self, mesh, name):
+        # Every car of one model, drawn with one call per part and level of detail
+        self.name = name
+        self.parts = [name, name + '_front', name + '_back']
+        self.vaos = {part: mesh.vao.instanced_vaos[part] for part in self.parts}
+        self.shadow_vaos = {part: mesh.vao.instanced_vaos[part + '_shadow'] for part in self.parts}
+        self.instance_vbos = {part: mesh.vao.vbo.instance_vbos[part] for part in self.parts}
+        self.program = mesh.vao.program.programs['instanced']
+        self.shadow_program = mesh.vao.program.programs['shadow_instanced']
+        self.skins = mesh.texture.textures[name + '_skins']
+        self.wheels = mesh.texture.textures[name + '_wheels']
+        self.depth_texture = mesh.texture.textures['depth_texture']
+        self.program['u_texture_0'] = 0
+        self.program['shadowMap'] = 1
+        self.program['u_resolution'].write(glm.vec2(mesh.app.WIN_SIZE))
+
+    @staticmethod
+    def get_part_models(car):
+        return car.body, car.front_tires, car.back_tires
+
+    def get_instance_data(self, cars, part):
+        instance_data = np.empty((len(cars), INSTANCE_SIZE), dtype='f4')
+        for row, car in zip(instance_data, cars):
+            if part == self.name:
+                m_model, layer = car.body.get_model_matrix(), int(car.variant) - 1
+            else:
+                wheels = car.front_tires if part == self.name + '_front' else car.back_tires
+                m_model, layer = wheels.get_world_matrix(), 0
+            row[:16] = np.frombuffer(m_model.to_bytes(), dtype='f4')
+            row[16] = layer
+        return instance_data
+
+    def draw(self, vaos, cars, part):
+        # Cars are grouped by the detail each part is seen at, the instance buffer of every level is filled apart
+        index = self.parts.index(part)
+        levels = [[] for _ in vaos[part]]
+        for car in cars:
+            levels[self.get_part_models(car)[index].get_lod()].append(car)
+        for lod, lod_cars in enumerate(levels):
+            for start in range(0, len(lod_cars), MAX_INSTANCES):
+                batch = lod_cars[start:start + MAX_INSTANCES]
+                self.instance_vbos[part][lod].write(self.get_instance_data(batch, part))
+                vaos[part][lod].render(instances=len(batch))
+
+    def update_program(self):
+        # Camera and light come from the shared uniform blocks, only the shadow map has to be bound once a frame
+        self.depth_texture.use(location=1)
+
+    def draw_parts(self, cars):
+        for part in self.parts:
+            # Only the body takes shadows, the wheels are lit like before
+            self.program['receive_shadows'] = part == self.name
+            (self.skins if part == self.name else self.wheels).use(location=0)
+            self.draw(self.vaos, cars, part)
+
+    def draw_shadow_parts(self, cars):
+        for part in self.parts:
+            self.draw(self.shadow_vaos, cars, part)
+
+    def render(self, cars):
+        self.update_program()
+        self.draw_parts(cars)
+
+    def render_shadow(self, cars):
+        self.draw_shadow_parts(cars)
@@ -1,5 +1,7 @@
 import glm
 
+from camera import get_frustum_planes
+
 
 class Light:
     def __init__(self, position=(100, 50, 100), color=(1, 1, 1)):
@@ -14,5 +16,9 @@ class Light:
     def get_view_matrix(self):
         return glm.lookAt(self.position, self.direction, glm.vec3(0, 1, 0))
 
+    def get_frustum_planes(self, m_proj):
+        # The shadow pass looks from the light through the camera's projection
+        return get_frustum_planes(m_proj * self.m_view_light)
+
     def update(self):
         self.m_view_light = self.get_view_matrix()
@@ -3,6 +3,9 @@ import moderngl as mgl
 import sys
 
 import config
+from custom_objects import ProfilerOverlay
+from frame_pacing import FramePacer, get_pacing_options
+from profiler import Profiler, startup
 from model import *
 from camera import Camera
 from light import Light
@@ -14,34 +17,45 @@ from scene_renderer import SceneRenderer
 
 class GraphicsEngine:
     def __init__(self, win_size=(1920, 1080)):
-        pg.init()
-        pg.display.set_caption("NBU Racer")
-        self.WIN_SIZE = win_size
-        pg.mixer.init()
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_MAJOR_VERSION, 3)
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
-        pg.mouse.set_visible(False)
-        self.screen = pg.display.set_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF)
+        with startup.phase('display'):
+            pg.init()
+            pg.display.set_caption("NBU Racer")
+            self.WIN_SIZE = win_size
+            pg.mixer.init()
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_MAJOR_VERSION, 3)
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
+            pg.mouse.set_visible(False)
+            self.frame_pacer = FramePacer(*get_pacing_options())
+            self.frame_pacer.set_display_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF)
 
         self.ctx = mgl.create_context()
+        # Where the frame ends up, the window here and an offscreen framebuffer when benchmarking
+        self.screen = self.ctx.screen
         self.ctx.enable(flags=mgl.DEPTH_TEST | mgl.CULL_FACE)
         self.ctx.enable(mgl.BLEND)
         self.ctx.blend_func = mgl.SRC_ALPHA, mgl.ONE_MINUS_SRC_ALPHA
         self.ctx.front_face = 'ccw'
-        self.clock = pg.time.Clock()
         self.running = True
 
         self.delta_time = 0
+        self.profiler = Profiler(self.ctx, enabled=config.global_variables['profiler'][0] == '1')
 
-        self.mesh = Mesh(self)
+        with startup.phase('mesh'):
+            self.mesh = Mesh(self)
+        self.profiler_overlay = ProfilerOverlay(self, self.profiler)
 
-        self.scene_manager = SceneManager(self)
+        with startup.phase('scenes'):
+            self.scene_manager = SceneManager(self)
 
     def check_events(self):
         for event in pg.event.get():
             if event.type == pg.QUIT:
                 self.quit()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                self.profiler.toggle_overlay()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F4:
+                self.profiler.dump()
 
     def quit(self):
         self.running = False
@@ -51,14 +65,27 @@ class GraphicsEngine:
     def render(self):
         self.ctx.clear(color=(0, 0, 0))
         self.scene_manager.render()
-        pg.display.flip()
+        if self.profiler.overlay_visible:
+            with self.profiler.scope('overlay'):
+                self.profiler_overlay.render()
+        with self.profiler.scope('flip'):
+            pg.display.flip()
 
     def run(self):
         while self.running:
-            self.check_events()
+            self.profiler.begin_frame()
+            with self.profiler.scope('events'):
+                self.check_events()
             self.scene_manager.current_scene.camera.update()
             self.render()
-            self.delta_time = self.clock.tick(60)
+            startup.mark_first_frame()
+            with self.profiler.scope('pacing'):
+                self.delta_time = self.frame_pacer.wait()
+            self.profiler.end_frame()
+        self.frame_pacer.print_stats()
+        if self.profiler.enabled:
+            self.profiler.dump()
+        self.profiler_overlay.release()
         self.mesh.destroy()
         self.scene_manager.destroy()
         config.save_options('options.txt')
@@ -66,7 +93,10 @@ class GraphicsEngine:
 
 
 if __name__ == "__main__":
-    config.parse_options('options.txt')
+    if '--profile-startup' in sys.argv:
+        startup.enable()
+    with startup.phase('options'):
+        config.parse_options('options.txt')
 
 
     while True:
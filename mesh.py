@@ -1,3 +1,7 @@
+import config
+from instancing import VehicleBatch
+from profiler import startup
+from static_batch import StaticBatch
 from vao import VAO
 from texture import Texture
 
@@ -6,8 +10,24 @@ class Mesh:
     def __init__(self, app):
         self.app = app
         self.vao = VAO(app.ctx)
-        self.texture = Texture(app)
+        with startup.phase('textures'):
+            self.texture = Texture(app)
+        self.vehicle_batches = {name: VehicleBatch(self, name) for name in config.global_variables['cars']}
+        # Baked static worlds by their objects, scenes building the same world share one
+        self.static_batches = {}
+
+    def get_static_batch(self, objects):
+        key = tuple((obj.vao_name, id(obj.texture), tuple(obj.pos), tuple(obj.rotation), tuple(obj.scale), obj.tiling)
+                    for obj in objects)
+        if key not in self.static_batches:
+            with startup.phase('static batch'):
+                self.static_batches[key] = StaticBatch(self, objects)
+        else:
+            # The cached batch takes this scene's objects, they pick the detail against this scene's camera
+            self.static_batches[key].objects = objects
+        return self.static_batches[key]
 
     def destroy(self):
+        [batch.destroy() for batch in self.static_batches.values()]
         self.vao.destroy()
         self.texture.destroy()
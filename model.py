@@ -3,6 +3,9 @@ import random
 import glm
 import random
 
+from assets import LOD_DISTANCES
+from camera import sphere_in_frustum
+
 
 class BasicImage:
     def __init__(self, scene, vao, tex_id, pos=(0, 0), rot=(0, 0), scale=(1, 1, 1), texture=None):
@@ -40,21 +43,85 @@ class BaseModel:
     def __init__(self, scene, vao_name, tex_id, pos=(0, 0, 0), rot=(0, 0, 0), scale=(1, 1, 1), tiling=1, texture=None):
         self.scene = scene
         self.app = scene.app
-        self.pos = pos
-        self.rotation = glm.vec3(rot)
-        self.scale = scale
+        # Set pos, rotation and scale rather than changing them in place, setting them is what clears the cached
+        # matrices
+        self._pos = glm.vec3(pos)
+        self._rotation = glm.vec3(rot)
+        self._scale = glm.vec3(scale)
+        self.m_model_cache = None
+        # Models placed relative to another one, drawn with parent model * m_offset * own model
+        self.parent = None
+        self.m_offset = glm.mat4()
+        self.m_world_cache = (None, None, None)
+        self.bounds_cache = (None, None)
         if texture is None:
             self.texture = self.app.mesh.texture.textures[tex_id]
         else:
             self.texture = texture
         self.vao_name = vao_name
         self.vao = self.app.mesh.vao.vaos[vao_name]
+        self.lod_vaos = self.app.mesh.vao.lod_vaos.get(vao_name, [])
+        # Bounding sphere of the mesh in model space, objects without one are never culled or simplified
+        self.bounds = self.app.mesh.vao.vbo.vbos[vao_name].bounds if vao_name in self.app.mesh.vao.vbo.vbos else None
+        if self.bounds is None:
+            self.lod_vaos = []
+        else:
+            self.bounds_center, self.bounds_radius = glm.vec3(self.bounds[0]), self.bounds[1]
         self.shader_program = self.vao.program
         self.tiling = tiling
-        self.m_model = self.get_model_matrix()
         self.camera = self.scene.camera
 
+    @property
+    def pos(self):
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos):
+        pos = glm.vec3(pos)
+        if pos != self._pos:
+            self._pos = pos
+            self.m_model_cache = None
+
+    @property
+    def rotation(self):
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, rotation):
+        rotation = glm.vec3(rotation)
+        if rotation != self._rotation:
+            self._rotation = rotation
+            self.m_model_cache = None
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @scale.setter
+    def scale(self, scale):
+        scale = glm.vec3(scale)
+        if scale != self._scale:
+            self._scale = scale
+            self.m_model_cache = None
+
     def get_model_matrix(self):
+        # Computed again only after the transform was set, static objects never pay for it past the first frame
+        if self.m_model_cache is None:
+            self.m_model_cache = self.compute_model_matrix()
+        return self.m_model_cache
+
+    def get_world_matrix(self):
+        # Recomposed only when the parent's or the own model matrix was recomputed, which replaces the object
+        if self.parent is None:
+            return self.get_model_matrix()
+        m_parent, m_model = self.parent.get_model_matrix(), self.get_model_matrix()
+        cached_parent, cached_model, m_world = self.m_world_cache
+        if m_parent is not cached_parent or m_model is not cached_model:
+            m_world = m_parent * self.m_offset * m_model
+            self.m_world_cache = (m_parent, m_model, m_world)
+        return m_world
+
+    def compute_model_matrix(self):
         m_model = glm.mat4()
         m_model = glm.translate(m_model, self.pos)
         m_model = glm.rotate(m_model, self.rotation.x, glm.vec3(1, 0, 0))
@@ -63,11 +130,43 @@ class BaseModel:
         m_model = glm.scale(m_model, self.scale)
         return m_model
 
+    def get_bounds_placement(self):
+        # The matrix placing the bounding sphere, and the model whose scale grows its radius
+        return self.get_world_matrix(), self
+
+    def get_world_bounds(self):
+        m_model, model = self.get_bounds_placement()
+        cached_model, bounds = self.bounds_cache
+        if m_model is not cached_model:
+            bounds = glm.vec3(m_model * glm.vec4(self.bounds_center, 1)), self.bounds_radius * max(model.scale)
+            self.bounds_cache = (m_model, bounds)
+        return bounds
+
+    def is_visible(self, planes):
+        if self.bounds is None:
+            return True
+        return sphere_in_frustum(planes, *self.get_world_bounds())
+
+    def get_lod(self):
+        # 0 is full detail, the camera's distance to the bounding sphere picks the coarser ones
+        if not self.lod_vaos:
+            return 0
+        center, radius = self.get_world_bounds()
+        distance = glm.length(center - self.camera.position) - radius
+        return sum(distance > limit for limit in LOD_DISTANCES[:len(self.lod_vaos)])
+
+    def get_vao(self, lod):
+        return self.vao if lod == 0 else self.lod_vaos[lod - 1]
+
     def render(self):
         self.update()
-        self.vao.render()
+        self.get_vao(self.get_lod()).render()
 
     def update(self):
+        self.texture.use(location=0)
+        self.update_model()
+
+    def update_model(self):
         ...
 
 
@@ -79,22 +178,10 @@ class ExtendedBaseModelShadowless(BaseModel):
     def on_init(self):
         self.shader_program['u_texture_0'] = 0
         self.texture.use()
-
-        self.shader_program['light.position'].write(self.scene.light.position)
-        self.shader_program['light.ambient'].write(self.scene.light.ambient)
-        self.shader_program['light.diffuse'].write(self.scene.light.diffuse)
-        self.shader_program['light.specular'].write(self.scene.light.specular)
-
-        self.shader_program['m_proj'].write(self.scene.camera.m_proj)
-        self.shader_program['m_view'].write(self.scene.camera.m_view)
-        self.shader_program['m_model'].write(self.m_model)
-
+        self.shader_program['m_model'].write(self.get_model_matrix())
         self.shader_program['tiling'] = self.tiling
 
-    def update(self):
-        self.texture.use(location=0)
-        self.shader_program['m_view'].write(self.scene.camera.m_view)
-        self.shader_program['camPos'].write(self.scene.camera.position)
+    def update_model(self):
         self.shader_program['m_model'].write(self.get_model_matrix())
         self.shader_program['tiling'] = self.tiling
 
@@ -106,25 +193,16 @@ class StaticBaseModel(BaseModel):
         self.m_model = m_model
         self.on_init()
 
+    def compute_model_matrix(self):
+        return self.m_model
+
     def on_init(self):
         self.shader_program['u_texture_0'] = 0
         self.texture.use()
-
-        self.shader_program['light.position'].write(self.scene.light.position)
-        self.shader_program['light.ambient'].write(self.scene.light.ambient)
-        self.shader_program['light.diffuse'].write(self.scene.light.diffuse)
-        self.shader_program['light.specular'].write(self.scene.light.specular)
-
-        self.shader_program['m_proj'].write(self.scene.camera.m_proj)
-        self.shader_program['m_view'].write(self.scene.camera.m_view)
         self.shader_program['m_model'].write(self.m_model)
-
         self.shader_program['tiling'] = self.tiling
 
-    def update(self):
-        self.texture.use(location=0)
-        self.shader_program['m_view'].write(self.scene.camera.m_view)
-        self.shader_program['camPos'].write(self.scene.camera.position)
+    def update_model(self):
         self.shader_program['m_model'].write(self.m_model)
         self.shader_program['tiling'] = self.tiling
 
@@ -136,37 +214,31 @@ class ExtendedBaseModel(ExtendedBaseModelShadowless):
 
     def on_init(self):
         super().on_init()
-        self.shader_program['m_view_light'].write(self.scene.light.m_view_light)
         self.shader_program['u_resolution'].write(glm.vec2(self.app.WIN_SIZE))
         self.depth_texture = self.app.mesh.texture.textures['depth_texture']
         self.shader_program['shadowMap'] = 1
         self.depth_texture.use(location=1)
         self.shadow_vao = self.app.mesh.vao.vaos[self.vao_name + '_shadow']
+        self.shadow_lod_vaos = self.app.mesh.vao.lod_vaos.get(self.vao_name + '_shadow', [])
         self.shadow_program = self.shadow_vao.program
-        self.shadow_program['m_proj'].write(self.camera.m_proj)
-        self.shadow_program['m_view_light'].write(self.scene.light.m_view_light)
-        self.shadow_program['m_model'].write(self.m_model)
-
-    def update(self):
-        super().update()
-        self.texture.use(location=0)
-        self.shader_program['m_view_light'].write(self.scene.light.m_view_light)
-        self.shader_program['light.position'].write(self.scene.light.position)
+        self.shadow_program['m_model'].write(self.get_model_matrix())
 
     def update_shadow(self):
-        self.shadow_program['m_view_light'].write(self.scene.light.m_view_light)
-        self.shadow_program['m_model'].write(self.m_model)
+        self.shadow_program['m_model'].write(self.get_model_matrix())
+
+    def get_shadow_vao(self, lod):
+        return self.shadow_vao if lod == 0 else self.shadow_lod_vaos[lod - 1]
 
     def render_shadow(self):
         self.update_shadow()
-        self.shadow_vao.render()
+        self.get_shadow_vao(self.get_lod()).render()
 
 
 class ExtendedBaseModelBody(ExtendedBaseModel):
     def __init__(self, app, vao_name, tex_id, pos=(0, 0, 0), rot=(0, 0, 0), scale=(1, 1, 1), tiling=1, texture=None):
         super().__init__(app, vao_name, tex_id, pos, rot, scale, tiling, texture)
 
-    def get_model_matrix(self):
+    def compute_model_matrix(self):
         m_model = glm.mat4()
         m_model = glm.translate(m_model, self.pos)
         m_model = glm.rotate(m_model, self.rotation.y, glm.vec3(0, 1, 0))
@@ -181,13 +253,18 @@ class ExtendedBaseModelWheel(ExtendedBaseModelShadowless):
         super().__init__(scene, vao_name, tex_id, pos, rot, scale, tiling, texture)
         self.m_offset = self.get_offset_matrix()
         self.car = car
+        self.parent = car.body
 
-    def get_model_matrix(self):
+    def compute_model_matrix(self):
         m_model = glm.mat4()
         m_model = glm.rotate(m_model, self.rotation.x, glm.vec3(1, 0, 0))
         m_model = glm.scale(m_model, self.scale)
         return m_model
 
+    def get_bounds_placement(self):
+        # Positions are car space once the centring offset is undone, so the car's matrix places the original bounds
+        return self.parent.get_model_matrix(), self.parent
+
     def get_offset_matrix(self):
         m_offset = glm.mat4()
         offset = (
@@ -195,10 +272,10 @@ class ExtendedBaseModelWheel(ExtendedBaseModelShadowless):
         m_offset = glm.translate(m_offset, offset)
         return m_offset
 
-    def update(self):
-        super().update()
+    def update_model(self):
+        super().update_model()
         self.shader_program['m_offset'].write(self.m_offset)
-        self.shader_program['m_car'].write(self.car.body.get_model_matrix())
+        self.shader_program['m_car'].write(self.parent.get_model_matrix())
 
 
 class ImagePlusModel(BasicImage):
@@ -242,5 +319,4 @@ class Skybox(ExtendedBaseModel):
         self.texture.use()
 
     def update(self):
-        m_view = glm.mat4(glm.mat3(self.camera.m_view))
-        self.shader_program['m_invProjView'].write(glm.inverse(self.camera.m_proj * m_view))
+        ...
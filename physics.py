@@ -0,0 +1,188 @@
+import math
+
+import glm
+import numpy as np
+
+import config
+
+
+class VehiclePhysics:
+    def __init__(self, car_id, pos=(0, 0, 0), rot=(0, 0, 0)):
+        self.id = car_id
+        self.name = config.global_variables['car_types'][self.id]
+        self.pos = glm.vec3(pos)
+        self.rotation = glm.vec3(rot)
+        self.wheel_rotation = 0
+        self.forward = glm.vec3(0, 0, -1)
+        self.up = glm.vec3(0, 1, 0)
+        self.side = glm.vec3(1, 0, 0)
+        attrs = config.global_variables['car_attributes'][self.name].split('x')
+        # How much can you turn the steering wheel
+        self.max_rotational_angle = 1
+        # How much the steering wheel is turned
+        self.rotational_angle = 0
+        # How fast the steering wheel turns every update
+        self.rotational_speed = float(attrs[0])
+        # How fast and in what direction is the car moving
+        self.velocity = 0
+        # How fast can the car accelerate
+        self.acceleration = float(attrs[1])
+        # How fast can the car decelerate
+        self.brake_effectiveness = float(attrs[2])
+        # How fast is the car at 100% gas
+        self.top_speed = float(attrs[3])
+        # How much speed the car loses every update
+        self.friction = float(attrs[4])
+
+        self.on_road = True
+
+        self.friction_off_road = 0.98
+        # GASSSSS!
+        self.gas = 0
+        self.update_rotation_v()
+
+    def update_rotation_v(self):
+        pitch, yaw, _ = self.rotation
+
+        self.forward.z = glm.cos(yaw) * glm.cos(pitch)
+        self.forward.y = glm.sin(pitch)
+        self.forward.x = glm.sin(yaw) * glm.cos(pitch)
+
+        self.forward = glm.normalize(self.forward)
+        self.side = glm.normalize(glm.cross(self.forward, glm.vec3(0, 1, 0)))
+        self.up = glm.normalize(glm.cross(self.side, self.forward))
+
+    # Rendered vehicles override these three to keep their models in sync
+    def move_wheel_rotation(self, rot):
+        self.wheel_rotation = self.wheel_rotation + rot
+
+    def update_rotation(self):
+        ...
+
+    def set_pos(self, pos):
+        self.pos = glm.vec3(pos)
+
+    def update_pos(self):
+        if self.gas >= 1:
+            self.gas -= 1
+        if self.gas > 0:
+            self.velocity += ((self.gas / 100) * self.top_speed)
+        if self.on_road:
+            self.velocity *= self.friction
+        else:
+            self.velocity *= self.friction_off_road
+
+        if self.velocity >= 1:
+            self.move_wheel_rotation(self.velocity / 2000)
+        if math.fabs(self.rotational_angle) * self.rotational_speed >= 0.001 and self.velocity > 10:
+            self.rotation.y += self.rotational_angle * self.rotational_speed * self.velocity / 500
+            self.rotational_angle *= 0.99
+
+        self.update_rotation_v()
+        self.update_rotation()
+        self.set_pos(self.pos + self.forward * self.velocity / 2000)
+
+    def accelerate(self):
+        if self.gas <= 100 - self.acceleration:
+            self.gas += self.acceleration
+
+    def hit_brake(self):
+        if self.velocity - self.brake_effectiveness >= 0:
+            self.velocity -= self.brake_effectiveness
+
+    def rotate(self, side):
+        if side:
+            if self.rotational_angle <= self.max_rotational_angle - self.rotational_speed:
+                self.rotational_angle += self.rotational_speed
+        else:
+            if self.rotational_angle >= -self.max_rotational_angle + self.rotational_speed:
+                self.rotational_angle -= self.rotational_speed
+
+
+class VehicleFleet:
+    def __init__(self):
+        # Every car is one row, the controls take boolean masks with one entry per car
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.pos = np.zeros((0, 3), dtype='f4')
+        self.yaw = np.zeros(0, dtype='f4')
+        self.pitch = np.zeros(0, dtype='f4')
+        self.forward = np.zeros((0, 3), dtype='f4')
+        self.wheel_rotation = np.zeros(0)
+        self.max_rotational_angle = np.zeros(0)
+        self.rotational_angle = np.zeros(0)
+        self.rotational_speed = np.zeros(0)
+        self.velocity = np.zeros(0)
+        self.acceleration = np.zeros(0)
+        self.brake_effectiveness = np.zeros(0)
+        self.top_speed = np.zeros(0)
+        self.friction = np.zeros(0)
+        self.friction_off_road = np.zeros(0)
+        self.gas = np.zeros(0)
+        self.on_road = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, car_id, pos=(0, 0, 0), rot=(0, 0, 0)):
+        # Takes its starting values from a scalar car so both backends agree on them
+        car = VehiclePhysics(car_id, pos, rot)
+        self.ids = np.append(self.ids, car.id)
+        self.pos = np.vstack([self.pos, np.array(car.pos, dtype='f4')])
+        self.pitch = np.append(self.pitch, car.rotation.x).astype('f4')
+        self.yaw = np.append(self.yaw, car.rotation.y).astype('f4')
+        self.forward = np.vstack([self.forward, np.array(car.forward, dtype='f4')])
+        for name in ('wheel_rotation', 'max_rotational_angle', 'rotational_angle', 'rotational_speed', 'velocity',
+                     'acceleration', 'brake_effectiveness', 'top_speed', 'friction', 'friction_off_road', 'gas',
+                     'on_road'):
+            setattr(self, name, np.append(getattr(self, name), getattr(car, name)))
+        return len(self.ids) - 1
+
+    def accelerate(self, cars):
+        cars = cars & (self.gas <= 100 - self.acceleration)
+        self.gas[cars] += self.acceleration[cars]
+
+    def hit_brake(self, cars):
+        cars = cars & (self.velocity - self.brake_effectiveness >= 0)
+        self.velocity[cars] -= self.brake_effectiveness[cars]
+
+    def rotate(self, cars, side):
+        if side:
+            cars = cars & (self.rotational_angle <= self.max_rotational_angle - self.rotational_speed)
+            self.rotational_angle[cars] += self.rotational_speed[cars]
+        else:
+            cars = cars & (self.rotational_angle >= -self.max_rotational_angle + self.rotational_speed)
+            self.rotational_angle[cars] -= self.rotational_speed[cars]
+
+    def apply_controls(self, controls):
+        # (M, 4) held gas, brake, left and right keys, in the order a single car applies them
+        self.accelerate(controls[:, 0])
+        self.hit_brake(controls[:, 1])
+        self.rotate(controls[:, 2], True)
+        self.rotate(controls[:, 3], False)
+
+    def update_pos(self):
+        self.gas[self.gas >= 1] -= 1
+        self.velocity += np.where(self.gas > 0, self.gas / 100 * self.top_speed, 0)
+        self.velocity *= np.where(self.on_road, self.friction, self.friction_off_road)
+
+        self.wheel_rotation += np.where(self.velocity >= 1, self.velocity / 2000, 0)
+        turning = (np.abs(self.rotational_angle) * self.rotational_speed >= 0.001) & (self.velocity > 10)
+        self.yaw += np.where(turning, self.rotational_angle * self.rotational_speed * self.velocity / 500,
+                             0).astype('f4')
+        self.rotational_angle[turning] *= 0.99
+
+        self.forward = np.stack([np.sin(self.yaw) * np.cos(self.pitch), np.sin(self.pitch),
+                                 np.cos(self.yaw) * np.cos(self.pitch)], axis=1)
+        self.forward /= np.linalg.norm(self.forward, axis=1, keepdims=True)
+        self.pos += self.forward * (self.velocity / 2000).astype('f4')[:, None]
+
+    def apply_to(self, row, car):
+        # Copies one row onto a scalar car, through the methods rendered vehicles override to move their models
+        car.gas = float(self.gas[row])
+        car.velocity = float(self.velocity[row])
+        car.rotational_angle = float(self.rotational_angle[row])
+        car.move_wheel_rotation(float(self.wheel_rotation[row]) - car.wheel_rotation)
+        car.rotation.y = float(self.yaw[row])
+        car.update_rotation_v()
+        car.update_rotation()
+        car.set_pos(self.pos[row].tolist())
@@ -0,0 +1,182 @@
+import csv
+import json
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# Frames kept for the overlay averages and the dumps
+PROFILE_WINDOW = 600
+PROFILE_CSV = 'profile.csv'
+PROFILE_TRACE = 'profile.trace.json'
+
+
+class Profiler:
+    def __init__(self, ctx, enabled=False):
+        self.ctx = ctx
+        self.enabled = enabled
+        self.overlay_visible = False
+        # One reusable timer query per GPU scope name
+        self.queries = {}
+        # GL allows a single time query at a time, nested scopes are timed on the CPU only
+        self.gpu_active = False
+        self.frame_start = None
+        self.scopes = []
+        self.pending_queries = []
+        # Finished frames as (start, [(name, start, end, gpu_ms)]), times in seconds from perf_counter
+        self.frames = deque(maxlen=PROFILE_WINDOW)
+        self.null_scope = nullcontext()
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+        self.enabled = self.enabled or self.overlay_visible
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.frame_start = time.perf_counter()
+        self.scopes = []
+        self.pending_queries = []
+
+    def end_frame(self):
+        if not self.enabled or self.frame_start is None:
+            return
+        # Read back after the flip, by then the GPU has usually finished the frame
+        gpu_times = {index: query.elapsed / 1e6 for index, query in self.pending_queries}
+        scopes = [(name, start, end, gpu_times.get(index)) for index, (name, start, end) in enumerate(self.scopes)]
+        self.frames.append((self.frame_start, scopes))
+        self.frame_start = None
+
+    def scope(self, name, gpu=False):
+        if not self.enabled or self.frame_start is None:
+            return self.null_scope
+        return self.timed(name, gpu and not self.gpu_active)
+
+    @contextmanager
+    def timed(self, name, gpu):
+        index = len(self.scopes)
+        self.scopes.append((name, 0, 0))
+        start = time.perf_counter()
+        if gpu:
+            query = self.queries.get(name)
+            if query is None:
+                query = self.queries[name] = self.ctx.query(time=True)
+            self.gpu_active = True
+            try:
+                with query:
+                    yield
+            finally:
+                self.gpu_active = False
+            self.pending_queries.append((index, query))
+        else:
+            yield
+        self.scopes[index] = (name, start, time.perf_counter())
+
+    def get_averages(self):
+        # Milliseconds per frame for every scope name, repeated scopes in a frame are summed
+        totals = {}
+        for _, scopes in self.frames:
+            for name, start, end, gpu_ms in scopes:
+                cpu, gpu = totals.get(name, (0, None))
+                if gpu_ms is not None:
+                    gpu = (gpu or 0) + gpu_ms
+                totals[name] = (cpu + (end - start) * 1000, gpu)
+        count = max(len(self.frames), 1)
+        return {name: (cpu / count, None if gpu is None else gpu / count) for name, (cpu, gpu) in totals.items()}
+
+    def dump_csv(self, path=PROFILE_CSV):
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['frame', 'scope', 'start_ms', 'cpu_ms', 'gpu_ms'])
+            for frame, (frame_start, scopes) in enumerate(self.frames):
+                for name, start, end, gpu_ms in scopes:
+                    writer.writerow([frame, name, f'{(start - frame_start) * 1000:.4f}', f'{(end - start) * 1000:.4f}',
+                                     '' if gpu_ms is None else f'{gpu_ms:.4f}'])
+
+    def dump_trace(self, path=PROFILE_TRACE):
+        # Chrome trace event format, open with chrome://tracing or Perfetto
+        events = []
+        for frame, (frame_start, scopes) in enumerate(self.frames):
+            for name, start, end, gpu_ms in scopes:
+                events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 'CPU', 'ts': start * 1e6,
+                               'dur': (end - start) * 1e6, 'args': {'frame': frame}})
+                if gpu_ms is not None:
+                    # GPU work is only measured in length, it is drawn starting with its CPU scope
+                    events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 'GPU', 'ts': start * 1e6,
+                                   'dur': gpu_ms * 1000, 'args': {'frame': frame}})
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def dump(self):
+        if not self.frames:
+            return
+        try:
+            self.dump_csv()
+            self.dump_trace()
+            print(f'Profile of {len(self.frames)} frames written to {PROFILE_CSV} and {PROFILE_TRACE}')
+        except OSError as e:
+            print(f'Could not write profile - {e}')
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.start = time.perf_counter()
+        # Finished phases in the order they started as (depth, name, seconds, allocated bytes)
+        self.phases = []
+        self.depth = 0
+        self.first_frame = None
+        self.null_phase = nullcontext()
+
+    def enable(self, trace_memory=True):
+        # Tracing allocations slows loading down, the regression benchmark measures time only
+        self.enabled = True
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.first_frame = None
+
+    def phase(self, name):
+        if not self.enabled:
+            return self.null_phase
+        return self.timed(name)
+
+    @contextmanager
+    def timed(self, name):
+        index = len(self.phases)
+        self.phases.append((self.depth, name, 0, 0))
+        self.depth += 1
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[0] - memory if tracemalloc.is_tracing() else 0
+            self.depth -= 1
+            self.phases[index] = (self.depth, name, elapsed, allocated)
+
+    def mark_first_frame(self):
+        if self.enabled and self.first_frame is None:
+            self.first_frame = time.perf_counter() - self.start
+            self.report()
+
+    def get_totals(self):
+        # Seconds spent in every top level phase
+        return {name: elapsed for depth, name, elapsed, _ in self.phases if depth == 0}
+
+    def report(self):
+        tracing = tracemalloc.is_tracing()
+        for depth, name, elapsed, allocated in self.phases:
+            memory = f'{allocated / 2 ** 20:+9.2f} MB' if tracing else ''
+            print(f'{"  " * depth + name:<48}{elapsed * 1000:9.1f} ms{memory}')
+        if tracing:
+            print(f'Python heap peak {tracemalloc.get_traced_memory()[1] / 2 ** 20:.2f} MB')
+        if self.first_frame is not None:
+            print(f'First frame after {self.first_frame:.3f}s')
+
+
+startup = StartupProfiler()
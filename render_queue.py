@@ -0,0 +1,34 @@
+class RenderQueue:
+    def __init__(self, shadow=False):
+        self.shadow = shadow
+        # Draws of one pass as (program, texture, vao) GL names followed by the texture, vao and model
+        self.items = []
+        # Draws and state changes of the last flush, shown by the profiler overlay
+        self.draws = 0
+        self.program_changes = 0
+        self.texture_changes = 0
+
+    def add(self, obj, lod):
+        if self.shadow:
+            vao, texture = obj.get_shadow_vao(lod), None
+        else:
+            vao, texture = obj.get_vao(lod), obj.texture
+        self.items.append((vao.program.glo, 0 if texture is None else texture.glo, vao.glo, texture, vao, obj))
+
+    def flush(self):
+        # Sorted so objects sharing a program, and within it a texture, are drawn one after another
+        self.items.sort(key=lambda item: item[:3])
+        program = texture = None
+        self.draws = len(self.items)
+        self.program_changes = self.texture_changes = 0
+        for program_glo, texture_glo, _, item_texture, vao, obj in self.items:
+            if program_glo != program:
+                program = program_glo
+                self.program_changes += 1
+            if item_texture is not None and texture_glo != texture:
+                texture = texture_glo
+                self.texture_changes += 1
+                item_texture.use(location=0)
+            obj.update_shadow() if self.shadow else obj.update_model()
+            vao.render()
+        self.items.clear()
@@ -0,0 +1,277 @@
+import json
+import math
+import os
+import queue
+import struct
+import sys
+import threading
+
+import numpy as np
+
+REPLAY_DIR = 'replays'
+# Kept next to, not inside, the replay directory, whose file count numbers new recordings
+REPLAY_INDEX_SUFFIX = '.index.json'
+REPLAY_INDEX_VERSION = 1
+REPLAY_MAGIC = b'NBUR'
+REPLAY_VERSION = 1
+# magic, version, car id, start slot (1-3), padding, finish time, event count
+REPLAY_HEADER = struct.Struct('<4sBBBxdI')
+TICK_DTYPE = np.dtype('<u4')
+ACTION_DTYPE = np.dtype('u1')
+# Ticks between background saves of a recording still in progress
+FLUSH_INTERVAL = 600
+
+
+class Replay:
+    def __init__(self, car, place, finish_time, ticks, actions, name=None):
+        self.car = car
+        self.place = place
+        self.finish_time = finish_time
+        # Sorted ticks and the action toggled on each of them, several events may share a tick
+        self.ticks = ticks
+        self.actions = actions
+        self.name = name
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if data.startswith(REPLAY_MAGIC):
+            return cls.from_bytes(data, os.path.basename(path))
+        return cls.from_text(data.decode(), os.path.basename(path))
+
+    @classmethod
+    def from_bytes(cls, data, name=None):
+        magic, version, car, place, finish_time, count = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f'Unsupported replay format in {name}')
+        offset = REPLAY_HEADER.size
+        ticks = np.frombuffer(data, dtype=TICK_DTYPE, count=count, offset=offset)
+        actions = np.frombuffer(data, dtype=ACTION_DTYPE, count=count, offset=offset + ticks.nbytes)
+        return cls(car, place, finish_time, ticks, actions, name)
+
+    @classmethod
+    def from_text(cls, text, name=None):
+        lines = text.splitlines()
+        car = int(lines[0])
+        place = int(lines[1])
+        finish_time = float('nan')
+        events = []
+        for line in lines[2:]:
+            if line.startswith('*'):
+                finish_time = float(line.split(' ')[1])
+            elif line:
+                tick, action = line.split(' ')
+                events.append((int(tick), int(action)))
+        events = np.array(events, dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(events[:, 0], kind='stable')
+        return cls(car, place, finish_time, events[order, 0].astype(TICK_DTYPE),
+                   events[order, 1].astype(ACTION_DTYPE), name)
+
+    def to_bytes(self):
+        header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.car, self.place, self.finish_time,
+                                    len(self.ticks))
+        return header + self.ticks.astype(TICK_DTYPE).tobytes() + self.actions.astype(ACTION_DTYPE).tobytes()
+
+    def save(self, path):
+        write_replay_file(path, self.to_bytes())
+
+    def get_actions(self, tick):
+        start, end = np.searchsorted(self.ticks, (tick, tick + 1))
+        return self.actions[start:end]
+
+
+def write_replay_file(path, data):
+    # Readers only ever see the old or the new file, never a partly written one
+    with open(path + '.tmp', 'wb') as file:
+        file.write(data)
+    os.replace(path + '.tmp', path)
+
+
+class ReplayRecorder:
+    def __init__(self, path, car, place, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.car = car
+        self.place = place
+        self.flush_interval = flush_interval
+        self.ticks = []
+        self.actions = []
+        self.flushed_tick = 0
+        self.finished = False
+        # Snapshots waiting for the writer thread, when it falls behind intermediate flushes are skipped
+        self.pending = queue.Queue(maxsize=2)
+        self.writer = threading.Thread(target=self.write_snapshots, daemon=True)
+        self.writer.start()
+
+    def record(self, tick, action):
+        self.ticks.append(tick)
+        self.actions.append(action)
+        if tick - self.flushed_tick >= self.flush_interval:
+            self.flush(tick)
+
+    def get_snapshot(self, finish_time):
+        return Replay(self.car, self.place, finish_time, np.array(self.ticks, dtype=TICK_DTYPE),
+                      np.array(self.actions, dtype=ACTION_DTYPE)).to_bytes()
+
+    def flush(self, tick):
+        self.flushed_tick = tick
+        try:
+            self.pending.put_nowait(self.get_snapshot(float('nan')))
+        except queue.Full:
+            pass
+
+    def finish(self, finish_time):
+        self.finished = True
+        self.pending.put(self.get_snapshot(finish_time))
+        self.pending.put(None)
+
+    def close(self, finish_time=float('nan')):
+        # Waits for the last snapshot to be written, an unfinished run is kept without a finish time
+        if not self.finished:
+            self.finish(finish_time)
+        self.writer.join()
+
+    def write_snapshots(self):
+        while True:
+            data = self.pending.get()
+            if data is None:
+                return
+            try:
+                write_replay_file(self.path, data)
+            except OSError as e:
+                print(f'Could not write replay {self.path} - {e}')
+
+
+class ReplayPlayer:
+    def __init__(self, replay):
+        self.replay = replay
+        self.ticks = replay.ticks.tolist()
+        self.actions = replay.actions.tolist()
+        # Index of the next event that has not fired yet
+        self.cursor = 0
+        # Held state of the gas, brake, left and right keys
+        self.controls = [False] * 4
+
+    def advance(self, tick):
+        while self.cursor < len(self.ticks) and self.ticks[self.cursor] <= tick:
+            action = self.actions[self.cursor]
+            self.controls[action] = not self.controls[action]
+            self.cursor += 1
+        return self.controls
+
+    def drive(self, car, tick):
+        accelerate, brake, left, right = self.advance(tick)
+        if accelerate:
+            car.accelerate()
+        if brake:
+            car.hit_brake()
+        if left:
+            car.rotate(True)
+        if right:
+            car.rotate(False)
+
+
+class ReplayBatchPlayer:
+    def __init__(self, replays):
+        # Events of all replays merged into one tick ordered stream, tagged with the row of their car, an empty
+        # fleet has an empty stream
+        ticks = np.concatenate([np.empty(0, dtype=TICK_DTYPE), *[replay.ticks for replay in replays]])
+        cars = np.concatenate([np.empty(0, dtype=np.intp),
+                               *[np.full(len(replay.ticks), row) for row, replay in enumerate(replays)]])
+        actions = np.concatenate([np.empty(0, dtype=ACTION_DTYPE), *[replay.actions for replay in replays]])
+        order = np.argsort(ticks, kind='stable')
+        self.ticks = ticks[order]
+        self.cars = cars[order]
+        self.actions = actions[order]
+        self.cursor = 0
+        self.controls = np.zeros((len(replays), 4), dtype=bool)
+
+    def advance(self, tick):
+        end = np.searchsorted(self.ticks, tick, side='right')
+        if end > self.cursor:
+            np.logical_xor.at(self.controls, (self.cars[self.cursor:end], self.actions[self.cursor:end]), True)
+            self.cursor = end
+        return self.controls
+
+
+def read_replay_header(path):
+    with open(path, 'rb') as file:
+        data = file.read(REPLAY_HEADER.size)
+        if data.startswith(REPLAY_MAGIC):
+            _, _, car, place, finish_time, _ = REPLAY_HEADER.unpack(data)
+        else:
+            # Text replays keep the finish time on their last line
+            file.seek(0)
+            car = int(file.readline())
+            place = int(file.readline())
+            file.seek(max(file.seek(0, os.SEEK_END) - 64, 0))
+            last_line = file.read().decode().splitlines()[-1]
+            finish_time = float(last_line.split(' ')[1]) if last_line.startswith('*') else float('nan')
+    return car, place, finish_time
+
+
+class ReplayCatalogue:
+    def __init__(self, directory=REPLAY_DIR):
+        self.directory = directory
+        self.index_path = os.path.normpath(directory) + REPLAY_INDEX_SUFFIX
+        self.entries = self.scan()
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if index.get('version') != REPLAY_INDEX_VERSION:
+            return {}
+        return index['replays']
+
+    def save_index(self, entries):
+        try:
+            with open(self.index_path + '.tmp', 'w') as file:
+                json.dump({'version': REPLAY_INDEX_VERSION, 'replays': entries}, file)
+            os.replace(self.index_path + '.tmp', self.index_path)
+        except OSError as e:
+            print(f'Could not write replay index - {e}')
+
+    def scan(self):
+        index = self.load_index()
+        entries = {}
+        for dir_entry in os.scandir(self.directory):
+            if dir_entry.name.endswith('.tmp'):
+                continue
+            stat = dir_entry.stat()
+            entry = index.get(dir_entry.name)
+            if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+                car, place, finish_time = read_replay_header(dir_entry.path)
+                entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'car': car, 'place': place,
+                         'finish_time': None if math.isnan(finish_time) else finish_time}
+            entries[dir_entry.name] = entry
+        if entries != index:
+            self.save_index(entries)
+        return entries
+
+    def get_finished(self, place):
+        # Recordings abandoned before the finish line have no time to race against
+        return [name for name, entry in self.entries.items()
+                if entry['place'] == place and entry['finish_time'] is not None]
+
+    def load(self, name):
+        return Replay.load(os.path.join(self.directory, name))
+
+
+def convert_replays(paths):
+    for path in paths:
+        with open(path, 'rb') as file:
+            if file.read(len(REPLAY_MAGIC)) == REPLAY_MAGIC:
+                continue
+        replay = Replay.load(path)
+        replay.save(path)
+        print(f'Converted {path} - {len(replay.ticks)} events')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        convert_replays(sys.argv[1:])
+    else:
+        convert_replays([os.path.join(REPLAY_DIR, file_name) for file_name in sorted(os.listdir(REPLAY_DIR))])
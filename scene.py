@@ -3,15 +3,26 @@ from abc import abstractmethod
 from camera import Camera
 from light import Light
 from model import *
+from simulation import TICK_RATE
+from vehicle import Vehicle
 import random
 
+# Length of one simulation tick in milliseconds, the unit of app.delta_time
+TICK_DURATION = 1000 / TICK_RATE
+# After a long frame the simulation catches up at most this many ticks and then slows down instead
+MAX_TICKS_PER_FRAME = 5
+
 
 class BasicScene:
     def __init__(self, scene_manager):
         self.scene_manager = scene_manager
         self.app = scene_manager.app
         self.objects = []
+        # Non-moving world objects, drawn merged by the static batch built after loading
+        self.static_objects = []
+        self.static_batch = None
         self.tick = 0
+        self.accumulator = 0
         self.light = Light()
         self.camera = Camera(self.app)
         self.skybox = None
@@ -20,6 +31,17 @@ class BasicScene:
     def add_object(self, obj):
         self.objects.append(obj)
 
+    def add_static_object(self, obj):
+        self.static_objects.append(obj)
+
+    def add_chunked_object(self, vao_name, tex_id):
+        # One object per chunk of a chunked mesh, so every chunk picks its own level of detail
+        for name in self.app.mesh.vao.vbo.chunks.get(vao_name, [vao_name]):
+            self.add_static_object(ExtendedBaseModel(self, vao_name=name, tex_id=tex_id))
+
+    def build_static_batch(self):
+        self.static_batch = self.app.mesh.get_static_batch(self.static_objects) if self.static_objects else None
+
     @abstractmethod
     def load(self):
        pass
@@ -28,7 +50,31 @@ class BasicScene:
     def custom_update(self):
         pass
 
+    def close(self):
+        # Called when the scene is left or the game quits
+        pass
+
+
+    def save_state(self):
+        self.camera.save_state()
+        for obj in self.objects:
+            if isinstance(obj, Vehicle):
+                obj.save_state()
+
+    def interpolate(self, alpha):
+        self.camera.interpolate(alpha)
+        for obj in self.objects:
+            if isinstance(obj, Vehicle):
+                obj.interpolate(alpha)
 
     def update(self):
-        self.tick += 1
-        self.custom_update()
+        # Runs whole ticks at TICK_RATE however fast frames come, and draws between the last two of them
+        self.accumulator = min(self.accumulator + self.app.delta_time, TICK_DURATION * MAX_TICKS_PER_FRAME)
+        while self.accumulator >= TICK_DURATION:
+            self.accumulator -= TICK_DURATION
+            self.save_state()
+            self.tick += 1
+            self.custom_update()
+            if self.scene_manager.current_scene is not self:
+                return
+        self.interpolate(self.accumulator / TICK_DURATION)
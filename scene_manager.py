@@ -1,3 +1,4 @@
+from profiler import startup
 from scene_renderer import SceneRenderer
 from bootloader import *
 
@@ -23,19 +24,29 @@ class SceneManager:
 
     def switch_scene(self, name):
         print(f'Switching to scene - {name}')
+        if self.current_scene is not None:
+            self.current_scene.close()
         self.current_scene = self.scenes[name]
         self.current_scene.tick = 0
+        self.current_scene.accumulator = 0
         self.current_scene.objects.clear()
-        self.current_scene.load()
+        self.current_scene.static_objects.clear()
+        with startup.phase(f'{name}.load'):
+            self.current_scene.load()
+        self.current_scene.build_static_batch()
+        self.current_scene.save_state()
         self.scene_renderer.update_scene()
 
     def resume_scene(self, name):
         print(f'Resuming scene - {name}')
         self.current_scene = self.scenes[name]
+        self.current_scene.accumulator = 0
+        self.current_scene.save_state()
         self.scene_renderer.update_scene()
 
     def render(self):
         self.scene_renderer.render()
 
     def destroy(self):
+        self.current_scene.close()
         self.scene_renderer.destroy()
@@ -1,4 +1,8 @@
-from model import ExtendedBaseModel
+from custom_objects import VehicleModel
+from model import ExtendedBaseModel, BaseModel
+from render_queue import RenderQueue
+from shader_program import UNIFORM_BLOCKS
+import glm
 import moderngl as mgl
 
 
@@ -8,34 +12,96 @@ class SceneRenderer:
         self.app = scene_manager.app
         self.ctx = self.app.ctx
         self.mesh = self.app.mesh
+        self.profiler = self.app.profiler
         self.scene = self.scene_manager.current_scene
         self.depth_texture = self.mesh.texture.textures['depth_texture']
         self.depth_fbo = self.ctx.framebuffer(depth_attachment=self.depth_texture)
+        self.queue = RenderQueue()
+        # std140 blocks, vec3 members are padded to 16 bytes
+        self.camera_ubo = self.ctx.buffer(reserve=2 * 64 + 16, dynamic=True)
+        self.light_ubo = self.ctx.buffer(reserve=4 * 16 + 64, dynamic=True)
+        self.shadow_queue = RenderQueue(shadow=True)
+
+    def get_vehicle_groups(self, planes):
+        # Visible cars by model, every model is drawn instanced
+        groups = {}
+        for obj in self.scene.objects:
+            if isinstance(obj, VehicleModel) and obj.is_visible(planes):
+                groups.setdefault(obj.name, []).append(obj)
+        return groups
+
+    def update_uniform_buffers(self):
+        camera, light = self.scene.camera, self.scene.light
+        self.camera_ubo.write(camera.m_proj.to_bytes() + camera.m_view.to_bytes() +
+                              glm.vec4(camera.position, 0).to_bytes())
+        self.light_ubo.write(b''.join(glm.vec4(value, 0).to_bytes() for value in
+                                      (light.position, light.ambient, light.diffuse, light.specular)) +
+                             light.m_view_light.to_bytes())
+        self.camera_ubo.bind_to_uniform_block(UNIFORM_BLOCKS['Camera'])
+        self.light_ubo.bind_to_uniform_block(UNIFORM_BLOCKS['Lighting'])
+
+    def render_vehicles(self, vehicle_groups, shadow=False):
+        # The car models share one program, its per frame state is set by the first batch for all
+        batches = [(self.mesh.vehicle_batches[name], cars) for name, cars in vehicle_groups.items()]
+        if not batches:
+            return
+        if not shadow:
+            batches[0][0].update_program()
+        for batch, cars in batches:
+            batch.draw_shadow_parts(cars) if shadow else batch.draw_parts(cars)
 
     def render_shadow(self):
         self.depth_fbo.clear()
         self.depth_fbo.use()
+        planes = self.scene.light.get_frustum_planes(self.scene.camera.m_proj)
+        if self.scene.static_batch is not None:
+            self.scene.static_batch.render_shadow(planes)
         for obj in self.scene.objects:
-            if isinstance(obj, ExtendedBaseModel):
-                obj.render_shadow()
+            if isinstance(obj, ExtendedBaseModel) and obj.is_visible(planes):
+                self.shadow_queue.add(obj, obj.get_lod())
+        self.shadow_queue.flush()
+        self.render_vehicles(self.get_vehicle_groups(planes), shadow=True)
 
     def main_render(self):
-        self.app.ctx.screen.use()
+        self.app.screen.use()
         if self.scene.skybox is not None:
             self.ctx.disable(mgl.DEPTH_TEST)
             self.scene.skybox.render()
             self.ctx.enable(mgl.DEPTH_TEST)
+        planes = self.scene.camera.get_frustum_planes()
+        # The queued objects only bind their own texture, the shadow map they sample stays on unit 1 for the pass
+        self.depth_texture.use(location=1)
+        # The opaque world goes first, the static part in one draw and the rest sorted by state, then the cars and
+        # the HUD in scene order
+        if self.scene.static_batch is not None:
+            self.scene.static_batch.render(planes)
+        for obj in self.scene.objects:
+            if isinstance(obj, BaseModel) and obj.is_visible(planes):
+                self.queue.add(obj, obj.get_lod())
+        self.queue.flush()
+        vehicle_groups = self.get_vehicle_groups(planes)
+        if vehicle_groups:
+            with self.profiler.scope('vehicles'):
+                self.render_vehicles(vehicle_groups)
         for obj in self.scene.objects:
-            obj.render()
+            if not isinstance(obj, (BaseModel, VehicleModel)):
+                # HUD elements, timed apart from the static world
+                with self.profiler.scope(type(obj).__name__):
+                    obj.render()
 
     def render(self):
-
-        self.scene.update()
-        self.render_shadow()
-        self.main_render()
+        with self.profiler.scope('scene.update'):
+            self.scene.update()
+        self.update_uniform_buffers()
+        with self.profiler.scope('render_shadow', gpu=True):
+            self.render_shadow()
+        with self.profiler.scope('main_render', gpu=True):
+            self.main_render()
 
     def update_scene(self):
         self.scene = self.scene_manager.current_scene
 
     def destroy(self):
         self.depth_fbo.release()
+        self.camera_ubo.release()
+        self.light_ubo.release()
@@ -1,3 +1,8 @@
+from profiler import startup
+
+# Binding points of the uniform blocks shared by every program, filled by the scene renderer once a frame
+UNIFORM_BLOCKS = {'Camera': 0, 'Lighting': 1}
+
 
 class ShaderProgram:
     def __init__(self,ctx):
@@ -7,18 +12,25 @@ class ShaderProgram:
         self.programs['default_wheels'] = self.get_program('default_wheels')
         self.programs['skybox'] = self.get_program('skybox')
         self.programs['shadow'] = self.get_program('shadow')
+        self.programs['instanced'] = self.get_program('instanced')
+        self.programs['shadow_instanced'] = self.get_program('shadow_instanced')
+        self.programs['static'] = self.get_program('static')
         self.programs['image'] = self.get_program('image')
         self.programs['imageplus'] = self.get_program('imageplus')
 
 
     def get_program(self, shader_name):
-        with open(f'shaders/{shader_name}.vert') as file:
-            vertex_shader = file.read()
+        with startup.phase(f'shaders/{shader_name}'):
+            with open(f'shaders/{shader_name}.vert') as file:
+                vertex_shader = file.read()
 
-        with open(f'shaders/{shader_name}.frag') as file:
-            fragment_shader = file.read()
+            with open(f'shaders/{shader_name}.frag') as file:
+                fragment_shader = file.read()
 
-        program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+            program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+            for block, binding in UNIFORM_BLOCKS.items():
+                if program.get(block, None) is not None:
+                    program[block].binding = binding
         return program
 
     def destroy(self):
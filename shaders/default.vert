@@ -9,10 +9,25 @@ out vec3 normal;
 out vec3 fragPos;
 out vec4 shadowCoord;
 
-uniform mat4 m_proj;
-uniform mat4 m_view;
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    vec3 camPos;
+};
+
+struct Light {
+    vec3 position;
+    vec3 ambient;
+    vec3 diffuse;
+    vec3 specular;
+};
+
+layout (std140) uniform Lighting {
+    Light light;
+    mat4 m_view_light;
+};
+
 uniform mat4 m_model;
-uniform mat4 m_view_light;
 
 
 mat4 m_shadow_bias = mat4(
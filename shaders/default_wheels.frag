@@ -12,12 +12,20 @@ struct Light {
     vec3 ambient;
     vec3 diffuse;
     vec3 specular;
+};
+
+layout (std140) uniform Lighting {
+    Light light;
+    mat4 m_view_light;
+};
 
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    vec3 camPos;
 };
 
-uniform Light light;
 uniform sampler2D u_texture_0;
-uniform vec3 camPos;
 uniform float tiling;
 
 
@@ -9,8 +9,12 @@ out vec2 uv_0;
 out vec3 normal;
 out vec3 fragPos;
 
-uniform mat4 m_proj;
-uniform mat4 m_view;
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    vec3 camPos;
+};
+
 uniform mat4 m_offset;
 uniform mat4 m_model;
 uniform mat4 m_car;
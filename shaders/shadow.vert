@@ -2,8 +2,24 @@
 
 layout (location=2) in vec3 in_position;
 
-uniform mat4 m_proj;
-uniform mat4 m_view_light;
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    vec3 camPos;
+};
+
+struct Light {
+    vec3 position;
+    vec3 ambient;
+    vec3 diffuse;
+    vec3 specular;
+};
+
+layout (std140) uniform Lighting {
+    Light light;
+    mat4 m_view_light;
+};
+
 uniform mat4 m_model;
 
 void main() {
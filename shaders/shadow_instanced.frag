@@ -0,0 +1,7 @@
+#version 330 core
+
+
+
+void main() {
+
+}
@@ -0,0 +1,27 @@
+#version 330 core
+
+layout (location=2) in vec3 in_position;
+layout (location=3) in mat4 in_model;
+
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    vec3 camPos;
+};
+
+struct Light {
+    vec3 position;
+    vec3 ambient;
+    vec3 diffuse;
+    vec3 specular;
+};
+
+layout (std140) uniform Lighting {
+    Light light;
+    mat4 m_view_light;
+};
+
+void main() {
+    mat4 mvp = m_proj * m_view_light * in_model;
+    gl_Position = mvp * vec4(in_position, 1.0);
+}
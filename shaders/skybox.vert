@@ -1,9 +1,15 @@
 #version 330 core
 layout (location = 0) in vec3 in_position;
 
-out vec4 clipCoords;
+out vec4 worldCoords;
+
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    vec3 camPos;
+};
 
 void main() {
     gl_Position = vec4(in_position, 1.0);
-    clipCoords = gl_Position;
+    worldCoords = inverse(m_proj * mat4(mat3(m_view))) * gl_Position;
 }
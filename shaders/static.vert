@@ -0,0 +1,50 @@
+#version 330
+
+layout (location = 0) in vec2 in_texCoord_0;
+layout (location = 1) in vec3 in_normal;
+layout (location = 2) in vec3 in_position;
+layout (location = 3) in float in_layer;
+
+out vec2 uv_0;
+out vec3 normal;
+out vec3 fragPos;
+out vec4 shadowCoord;
+flat out float layer;
+
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    vec3 camPos;
+};
+
+struct Light {
+    vec3 position;
+    vec3 ambient;
+    vec3 diffuse;
+    vec3 specular;
+};
+
+layout (std140) uniform Lighting {
+    Light light;
+    mat4 m_view_light;
+};
+
+
+mat4 m_shadow_bias = mat4(
+    0.5,0.0,0.0,0.0,
+    0.0,0.5,0.0,0.0,
+    0.0,0.0,0.5,0.0,
+    0.5,0.5,0.5,1.0
+);
+
+void main() {
+    uv_0 = in_texCoord_0;
+    layer = in_layer;
+    fragPos = in_position;
+    normal = in_normal;
+    gl_Position = m_proj * m_view * vec4(in_position ,1.0);
+
+    mat4 shadowMVP = m_proj * m_view_light;
+    shadowCoord = m_shadow_bias* shadowMVP * vec4(in_position, 1.0);
+    shadowCoord.z -= 0.005;
+}
@@ -0,0 +1,160 @@
+import random
+import time
+
+import numpy as np
+
+import config
+from physics import VehiclePhysics, VehicleFleet
+from replay import ReplayCatalogue, ReplayPlayer, ReplayBatchPlayer
+from track import TrackPath, LapTracker, RACE_LAPS, FINISH_SEGMENT, LAP_COVERAGE
+
+TICK_RATE = 60
+# The starting sequence ends on tick 351, race logic runs from the next update
+FIRST_RACE_TICK = 352
+# Cars that have not finished by then are given up on
+MAX_RACE_TICKS = TICK_RATE * 60 * 10
+CAR_POSITIONS = [(23, 0.1, 29), (20.8, 0.1, 33), (17.5, 0.1, 25.9), (15.2, 0.1, 29.9)]
+START_ROTATION = (0, 1.05, 0)
+# scalar steps every car on its own, fleet steps the replay-driven cars as one VehicleFleet
+PHYSICS_BACKENDS = ('scalar', 'fleet')
+
+
+def get_physics_backend():
+    return config.global_variables['physics_backends'][int(config.global_variables['physics'][0])]
+
+
+class RaceSimulation:
+    def __init__(self, track, laps=RACE_LAPS, backend='scalar'):
+        if backend not in PHYSICS_BACKENDS:
+            raise ValueError(f'Unknown physics backend {backend}')
+        self.track = track
+        self.laps = laps
+        self.backend = backend
+        self.tick = FIRST_RACE_TICK - 1
+        self.cars = []
+        self.drivers = []
+        self.lap_trackers = []
+        self.finish_ticks = []
+        # Last known segment of every car, -1 until it is first seen on the road
+        self.segments = np.full(0, -1)
+        # With the fleet backend, the replay-driven cars by fleet row and the replays driving them
+        self.fleet = VehicleFleet()
+        self.fleet_cars = []
+        self.fleet_replays = []
+        self.fleet_player = None
+
+    def add_car(self, car, driver=None):
+        # Cars without a driver are controlled from outside between steps
+        if self.backend == 'fleet' and isinstance(driver, ReplayPlayer):
+            self.fleet.add(car.id, pos=car.pos, rot=car.rotation)
+            self.fleet_cars.append(len(self.cars))
+            self.fleet_replays.append(driver.replay)
+            self.fleet_player = ReplayBatchPlayer(self.fleet_replays)
+        self.cars.append(car)
+        self.drivers.append(driver)
+        self.lap_trackers.append(LapTracker(self.track, self.laps))
+        self.finish_ticks.append(None)
+        self.segments = np.append(self.segments, -1)
+        return len(self.cars) - 1
+
+    def add_replay_car(self, replay):
+        car = VehiclePhysics(replay.car, pos=CAR_POSITIONS[replay.place], rot=START_ROTATION)
+        return self.add_car(car, ReplayPlayer(replay))
+
+    def step(self, tick=None):
+        self.tick = self.tick + 1 if tick is None else tick
+        segments, on_road = self.track.classify([car.pos for car in self.cars], self.segments)
+        self.segments = np.where(on_road, segments, self.segments)
+        if self.fleet_cars:
+            self.step_fleet(on_road)
+        for index, (segment, car_on_road) in enumerate(zip(segments.tolist(), on_road.tolist())):
+            car = self.cars[index]
+            car.on_road = car_on_road
+            if index not in self.fleet_cars:
+                if self.drivers[index] is not None:
+                    self.drivers[index].drive(car, self.tick)
+                car.update_pos()
+            if self.lap_trackers[index].update(segment) and self.lap_trackers[index].finished:
+                self.finish_ticks[index] = self.tick
+
+    def step_fleet(self, on_road):
+        self.fleet.on_road = on_road[self.fleet_cars]
+        self.fleet.apply_controls(self.fleet_player.advance(self.tick))
+        self.fleet.update_pos()
+        for row, index in enumerate(self.fleet_cars):
+            self.fleet.apply_to(row, self.cars[index])
+
+    def is_finished(self):
+        return all(tick is not None for tick in self.finish_ticks)
+
+    def get_finish_times(self):
+        # Race time counts from the scene load, like the recorded times
+        return [None if tick is None else tick / TICK_RATE for tick in self.finish_ticks]
+
+    def run(self, max_ticks=MAX_RACE_TICKS):
+        while not self.is_finished() and self.tick < max_ticks:
+            self.step()
+        return self.get_finish_times()
+
+
+class FleetSimulation:
+    def __init__(self, track, replays, laps=RACE_LAPS):
+        # Replay-driven cars only, with their physics and lap tracking done in one pass for all of them
+        self.track = track
+        self.laps = laps
+        self.tick = FIRST_RACE_TICK - 1
+        self.fleet = VehicleFleet()
+        for replay in replays:
+            self.fleet.add(replay.car, pos=CAR_POSITIONS[replay.place], rot=START_ROTATION)
+        self.player = ReplayBatchPlayer(replays)
+        self.segments = np.full(len(replays), -1)
+        self.visited = np.zeros((len(replays), track.segment_count), dtype=bool)
+        self.lap_counts = np.zeros(len(replays), dtype=np.int32)
+        self.finished = np.zeros(len(replays), dtype=bool)
+        self.finish_ticks = np.full(len(replays), -1)
+
+    def step(self, tick=None):
+        self.tick = self.tick + 1 if tick is None else tick
+        segments, on_road = self.track.classify(self.fleet.pos, self.segments)
+        self.segments = np.where(on_road, segments, self.segments)
+        self.fleet.on_road = on_road
+        self.fleet.apply_controls(self.player.advance(self.tick))
+        self.fleet.update_pos()
+        self.update_laps(segments, on_road & ~self.finished)
+
+    def update_laps(self, segments, active):
+        rows = np.flatnonzero(active)
+        self.visited[rows, segments[rows]] = True
+        crossed = active & (segments == FINISH_SEGMENT)
+        crossed &= self.visited.sum(axis=1) >= self.track.segment_count * LAP_COVERAGE
+        self.lap_counts += crossed
+        self.visited[crossed] = False
+        done = crossed & (self.lap_counts == self.laps)
+        self.finished |= done
+        self.finish_ticks[done] = self.tick
+
+    def is_finished(self):
+        return bool(self.finished.all())
+
+    def get_finish_times(self):
+        return [None if tick < 0 else tick / TICK_RATE for tick in self.finish_ticks.tolist()]
+
+    def run(self, max_ticks=MAX_RACE_TICKS):
+        while not self.is_finished() and self.tick < max_ticks:
+            self.step()
+        return self.get_finish_times()
+
+
+if __name__ == "__main__":
+    config.parse_options('options.txt')
+    catalogue = ReplayCatalogue()
+    simulation = RaceSimulation(TrackPath())
+    names = [random.choice(catalogue.get_finished(place)) for place in range(1, 4)]
+    for name in names:
+        simulation.add_replay_car(catalogue.load(name))
+    start = time.perf_counter()
+    times = simulation.run()
+    elapsed = time.perf_counter() - start
+    for name, finish_time in zip(names, times):
+        print(f'{name}: {finish_time}')
+    print(f'Simulated {simulation.tick} ticks in {elapsed:.3f}s ({simulation.tick / TICK_RATE / elapsed:.0f}x real time)')
@@ -0,0 +1,139 @@
+import glm
+import numpy as np
+
+from assets import VERTEX_SIZE
+
+# Layers of the world texture array are scaled to one size
+STATIC_TEXTURE_SIZE = (1024, 1024)
+# Uv, world space normal and position, texture array layer
+STATIC_FORMAT = '2f 3f 3f 1f'
+STATIC_ATTRIBUTES = ['in_texCoord_0', 'in_normal', 'in_position', 'in_layer']
+
+
+def get_source_vertices(vbo):
+    # Chunks draw from the vertices of their whole mesh
+    return getattr(vbo, 'parent', vbo).vertex_data
+
+
+def bake_vertices(vertices, m_model, tiling, layer):
+    vertices = np.asarray(vertices, dtype='f4').reshape(-1, VERTEX_SIZE)
+    matrix = np.array(m_model, dtype='f4')
+    normals = vertices[:, 2:5] / np.linalg.norm(vertices[:, 2:5], axis=1, keepdims=True)
+    baked = np.empty((len(vertices), VERTEX_SIZE + 1), dtype='f4')
+    baked[:, 0:2] = vertices[:, 0:2] * tiling
+    baked[:, 2:5] = normals @ np.linalg.inv(matrix[:3, :3])
+    baked[:, 5:8] = vertices[:, 5:8] @ matrix[:3, :3].T + matrix[:3, 3]
+    baked[:, 8] = layer
+    return baked
+
+
+class StaticBatch:
+    def __init__(self, mesh, objects):
+        # Every static world object baked into one vertex and one index buffer, drawn with a few ranged calls per
+        # pass, the objects are kept for their bounds and level of detail
+        self.ctx = mesh.app.ctx
+        self.objects = objects
+        self.textures = []
+        for obj in objects:
+            if all(obj.texture is not texture for texture in self.textures):
+                self.textures.append(obj.texture)
+        names = {id(texture): name for name, texture in mesh.texture.textures.items()}
+        self.texture = mesh.texture.get_texture_array([mesh.texture.paths[names[id(texture)]]
+                                                       for texture in self.textures], size=STATIC_TEXTURE_SIZE)
+
+        vertex_data, lods = self.merge(mesh.vao.vbo.vbos)
+        self.vbo = self.ctx.buffer(vertex_data)
+        # Every level of detail of every object written once, both passes draw ranges of it
+        index_data, self.ranges = self.get_index_data(lods)
+        self.ibo = self.ctx.buffer(index_data)
+        self.program = mesh.vao.program.programs['static']
+        self.shadow_program = mesh.vao.program.programs['shadow']
+        self.vao = self.get_vao(self.program)
+        self.shadow_vao = self.get_vao(self.shadow_program)
+        self.depth_texture = mesh.texture.textures['depth_texture']
+        self.program['u_texture_0'] = 0
+        self.program['shadowMap'] = 1
+        self.program['u_resolution'].write(glm.vec2(mesh.app.WIN_SIZE))
+        # (visible levels of detail, (first, count) draws) of the last frame of each pass, nothing is uploaded
+        self.state = (None, [])
+        self.shadow_state = (None, [])
+
+    def merge(self, vbos):
+        # Objects sharing a mesh, placement, texture and tiling, like the chunks of one mesh, share baked vertices
+        blocks = {}
+        vertex_blocks = []
+        offset = 0
+        lods = []
+        for obj in self.objects:
+            vbo = vbos[obj.vao_name]
+            source = get_source_vertices(vbo)
+            layer = next(i for i, texture in enumerate(self.textures) if texture is obj.texture)
+            key = (id(source), obj.get_model_matrix().to_bytes(), layer, obj.tiling)
+            if key not in blocks:
+                vertex_blocks.append(bake_vertices(source, obj.get_model_matrix(), obj.tiling, layer))
+                blocks[key] = offset
+                offset += len(vertex_blocks[-1])
+            lods.append([np.asarray(indices, dtype='u4') + np.uint32(blocks[key])
+                         for indices in [vbo.get_index_data(), *vbo.get_lod_index_data()]])
+        return np.concatenate(vertex_blocks), lods
+
+    @staticmethod
+    def get_index_data(lods):
+        # Laid out level by level and in object order within a level, so neighbouring chunks seen at the same detail
+        # are one contiguous range
+        parts = []
+        ranges = [[None] * len(obj_lods) for obj_lods in lods]
+        first = 0
+        for lod in range(max(len(obj_lods) for obj_lods in lods)):
+            for i, obj_lods in enumerate(lods):
+                if lod < len(obj_lods):
+                    parts.append(obj_lods[lod])
+                    ranges[i][lod] = (first, len(obj_lods[lod]))
+                    first += len(obj_lods[lod])
+        return np.concatenate(parts), ranges
+
+    def get_vao(self, program):
+        return self.ctx.vertex_array(program, [(self.vbo, STATIC_FORMAT, *STATIC_ATTRIBUTES)], index_buffer=self.ibo,
+                                     index_element_size=4, skip_errors=True)
+
+    def get_levels(self, planes):
+        # Level of detail of every object, -1 for culled ones
+        return tuple(obj.get_lod() if obj.is_visible(planes) else -1 for obj in self.objects)
+
+    def get_state(self, planes, state):
+        # Ranges of the visible objects at their level of detail, adjacent ones merged into one draw
+        levels = self.get_levels(planes)
+        if levels == state[0]:
+            return state
+        draws = []
+        for first, count in sorted(self.ranges[i][lod] for i, lod in enumerate(levels) if lod >= 0):
+            if draws and sum(draws[-1]) == first:
+                draws[-1] = (draws[-1][0], draws[-1][1] + count)
+            else:
+                draws.append((first, count))
+        return levels, draws
+
+    def render(self, planes):
+        self.state = self.get_state(planes, self.state)
+        draws = self.state[1]
+        if draws:
+            self.texture.use(location=0)
+            self.depth_texture.use(location=1)
+        for first, count in draws:
+            self.vao.render(vertices=count, first=first)
+
+    def render_shadow(self, planes):
+        self.shadow_state = self.get_state(planes, self.shadow_state)
+        draws = self.shadow_state[1]
+        if draws:
+            # Positions are baked in world space
+            self.shadow_program['m_model'].write(glm.mat4())
+        for first, count in draws:
+            self.shadow_vao.render(vertices=count, first=first)
+
+    def destroy(self):
+        self.vao.release()
+        self.shadow_vao.release()
+        self.vbo.release()
+        self.ibo.release()
+        self.texture.release()
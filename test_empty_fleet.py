@@ -0,0 +1,26 @@
+from replay import ReplayBatchPlayer
+from simulation import FleetSimulation, FIRST_RACE_TICK
+from track import TrackPath
+from validate_replays import validate, DEFAULT_TOLERANCE
+
+
+def make_track(tmp_path):
+    path = tmp_path / 'Track_path.txt'
+    path.write_text(''.join(f'v {x * 4} 0 0\n' for x in range(20)))
+    return TrackPath(str(path))
+
+
+def test_validate_without_replays(tmp_path):
+    assert validate([], str(tmp_path), DEFAULT_TOLERANCE, 2, 'options.txt', fleet=True) == 0
+    assert validate([], str(tmp_path), DEFAULT_TOLERANCE, 2, 'options.txt') == 0
+
+
+def test_batch_player_without_replays():
+    player = ReplayBatchPlayer([])
+    assert player.advance(FIRST_RACE_TICK).shape == (0, 4)
+
+
+def test_fleet_simulation_without_replays(tmp_path):
+    simulation = FleetSimulation(make_track(tmp_path), [])
+    simulation.step()
+    assert simulation.run() == []
@@ -12,3 +12,17 @@ def generate_text_texture(ctx, text, font, color=(0, 0, 0), size=None):
     texture = ctx.texture(size=surface.get_size(), components=4, data=pg.image.tostring(surface, 'RGBA'))
 
     return texture, size
+
+
+def generate_text_block_texture(ctx, lines, font, color=(0, 0, 0), background=(0, 0, 0, 255)):
+    # Stacks the lines on an opaque background, the image shader drops mostly transparent pixels
+    line_height = font.get_linesize()
+    size = (max(font.size(line)[0] for line in lines), line_height * len(lines))
+    surface = pg.Surface(size, flags=pg.SRCALPHA)
+    surface.fill(background)
+    for i, line in enumerate(lines):
+        surface.blit(font.render(line, True, color), (0, i * line_height))
+    surface = pg.transform.flip(surface, flip_x=False, flip_y=True)
+    texture = ctx.texture(size=surface.get_size(), components=4, data=pg.image.tostring(surface, 'RGBA'))
+
+    return texture, size
@@ -4,6 +4,9 @@ import pygame as pg
 import moderngl as mgl
 from PIL import Image
 
+import config
+from profiler import startup
+
 
 class Texture:
     def __init__(self, app):
@@ -13,15 +16,34 @@ class Texture:
         texture_dir = 'textures'
         texture_files = os.listdir(texture_dir)
 
+        # Car skins and wheels are loaded as texture arrays, a layer per skin, for instanced drawing
+        car_textures = {}
+        for name, variants in config.global_variables['cars'].items():
+            car_textures[f'{name}_skins'] = [f'{name}_{i}.png' for i in range(1, int(variants) + 1)]
+            car_textures[f'{name}_wheels'] = [f'{name}_wheels.png']
+        array_files = {file_name for file_names in car_textures.values() for file_name in file_names}
+
         self.textures = {}
+        # Image file of every texture loaded from one, for building texture arrays out of them later
+        self.paths = {}
         for file_name in texture_files:
-            if file_name.endswith('.png'):
-                texture_name = os.path.splitext(file_name)[0]
-                self.textures[texture_name] = self.get_texture_A(path=os.path.join(texture_dir, file_name))
-            elif file_name.endswith('.jpg'):
-                texture_name = os.path.splitext(file_name)[0]
-                self.textures[texture_name] = self.get_texture(path=os.path.join(texture_dir, file_name))
-        self.textures['skybox'] = self.get_texture_cube(path='textures/')
+            with startup.phase(f'textures/{file_name}'):
+                if file_name in array_files:
+                    continue
+                elif file_name.endswith('.png'):
+                    texture_name = os.path.splitext(file_name)[0]
+                    self.textures[texture_name] = self.get_texture_A(path=os.path.join(texture_dir, file_name))
+                    self.paths[texture_name] = os.path.join(texture_dir, file_name)
+                elif file_name.endswith('.jpg'):
+                    texture_name = os.path.splitext(file_name)[0]
+                    self.textures[texture_name] = self.get_texture(path=os.path.join(texture_dir, file_name))
+                    self.paths[texture_name] = os.path.join(texture_dir, file_name)
+        for texture_name, file_names in car_textures.items():
+            with startup.phase(f'textures/{texture_name}'):
+                self.textures[texture_name] = self.get_texture_array(
+                    paths=[os.path.join(texture_dir, file_name) for file_name in file_names])
+        with startup.phase('skybox'):
+            self.textures['skybox'] = self.get_texture_cube(path='textures/')
         self.textures['depth_texture'] = self.get_depth_texture()
 
     def get_depth_texture(self):
@@ -68,5 +90,23 @@ class Texture:
         texture.anisotropy = 32.0
         return texture
 
+    def get_texture_array(self, paths, size=None):
+        # Layers must share one size, the skins of a car are painted on the same UV layout, unrelated images are
+        # scaled to the given size instead
+        resize = size is not None
+        size = size or Image.open(paths[0]).size
+        texture = self.ctx.texture_array((*size, len(paths)), 4)
+        for layer, path in enumerate(paths):
+            image = Image.open(path).transpose(Image.FLIP_TOP_BOTTOM).convert("RGBA")
+            if resize:
+                image = image.resize(size, Image.LANCZOS)
+            elif image.size != size:
+                raise ValueError(f'Texture {path} is {image.size}, expected {size}')
+            texture.write(image.tobytes(), viewport=(0, 0, layer, *size, 1))
+        texture.filter = (mgl.LINEAR_MIPMAP_LINEAR, mgl.LINEAR)
+        texture.build_mipmaps()
+        texture.anisotropy = 32.0
+        return texture
+
     def destroy(self):
         [tex.release() for tex in self.textures.values()]
@@ -0,0 +1,214 @@
+import json
+import math
+import os
+
+import numpy as np
+
+TRACK_PATH = 'objects/Track_path.txt'
+# Road segments are rectangles centered on each path point, this wide across and long along the track
+SEGMENT_HALF_WIDTH = 5
+SEGMENT_HALF_LENGTH = 3
+# Crossing this segment counts as passing the finish line
+FINISH_SEGMENT = 17
+# Share of the segments a car has to visit for crossing the finish line to count as a lap
+LAP_COVERAGE = 80 / 100
+RACE_LAPS = 3
+GRID_CELL_SIZE = 8
+# Segments checked around the last known one before falling back to the grid
+NEIGHBOUR_OFFSETS = (0, 1, -1, 2, -2, 3, -3)
+# Bump when the layout of the cached segment table changes
+CACHE_VERSION = 1
+# corners: x/z of the segment corners, same order as a (-1,-1), (-1,1), (1,-1), (1,1) unit quad
+# axes: across and along edges scaled so the segment spans [0, 1] from its first corner
+# direction: x/z tangent of the path, arc_length: distance along the path to the segment start
+SEGMENT_DTYPE = np.dtype([('corners', 'f4', (4, 2)), ('axes', 'f4', (2, 2)), ('direction', 'f4', (2,)),
+                          ('arc_length', 'f4')])
+
+
+class TrackPath:
+    def __init__(self, path=TRACK_PATH, cell_size=GRID_CELL_SIZE, half_width=SEGMENT_HALF_WIDTH):
+        self.path = path
+        self.cell_size = cell_size
+        self.half_width = half_width
+        # Tracks of other widths keep their own cache next to the default one
+        self.cache_path = path if half_width == SEGMENT_HALF_WIDTH else f'{path}.w{half_width:g}'
+        cached = self.load_cache()
+        if cached is None:
+            cached = self.build()
+            self.save_cache(*cached)
+        self.segments, self.grid, self.grid_origin = cached
+        self.segment_count = len(self.segments)
+        self.corners = self.segments['corners']
+        self.origins = self.corners[:, 0]
+        self.axes = self.segments['axes']
+        self.directions = self.segments['direction']
+        self.arc_lengths = self.segments['arc_length']
+        self.frames = np.hstack([self.origins, self.axes.reshape(-1, 4)]).tolist()
+
+    @staticmethod
+    def load_marks(path):
+        marks = []
+        with open(path, 'r') as file:
+            for line in file:
+                if line.startswith('v'):
+                    _, x, y, z = line.split()
+                    marks.append((float(x), float(y), float(z)))
+        return np.array(marks, dtype='f4')
+
+    def build(self):
+        marks = self.load_marks(self.path)
+        segments = np.zeros(len(marks) - 1, dtype=SEGMENT_DTYPE)
+        delta = marks[1:] - marks[:-1]
+        lengths = np.linalg.norm(delta, axis=1)
+        direction = (delta / lengths[:, None])[:, ::2]
+        # cross((0, 1, 0), direction) on the ground plane
+        right = np.stack([direction[:, 1], -direction[:, 0]], axis=1)
+        corners = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+        corners = np.stack([marks[:-1, ::2] + right * x * self.half_width - direction * z * SEGMENT_HALF_LENGTH
+                            for x, z in corners], axis=1)
+        across = corners[:, 2] - corners[:, 0]
+        along = corners[:, 1] - corners[:, 0]
+        segments['corners'] = corners
+        segments['axes'] = np.stack([across / np.sum(across ** 2, axis=1, keepdims=True),
+                                     along / np.sum(along ** 2, axis=1, keepdims=True)], axis=1)
+        segments['direction'] = direction
+        segments['arc_length'][1:] = np.cumsum(lengths[:-1])
+        grid, grid_origin = self.build_grid(corners)
+        return segments, grid, grid_origin
+
+    def build_grid(self, corners):
+        lows = np.floor(corners.min(axis=1) / self.cell_size).astype(np.int32)
+        highs = np.floor(corners.max(axis=1) / self.cell_size).astype(np.int32)
+        origin = lows.min(axis=0)
+        size_x, size_z = (highs.max(axis=0) - origin + 1).tolist()
+        cells = [[[] for _ in range(size_z)] for _ in range(size_x)]
+        for index, (low, high) in enumerate(zip((lows - origin).tolist(), (highs - origin).tolist())):
+            for cell_x in range(low[0], high[0] + 1):
+                for cell_z in range(low[1], high[1] + 1):
+                    cells[cell_x][cell_z].append(index)
+        # Dense (X, Z, K) table of segment indices per cell, padded with -1
+        depth = max(len(cell) for column in cells for cell in column)
+        grid = np.full((size_x, size_z, depth), -1, dtype=np.int32)
+        for cell_x, column in enumerate(cells):
+            for cell_z, cell in enumerate(column):
+                grid[cell_x, cell_z, :len(cell)] = cell
+        return grid, origin.tolist()
+
+    def get_cache_key(self):
+        stat = os.stat(self.path)
+        return {'version': CACHE_VERSION, 'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+                'cell_size': self.cell_size, 'half_width': self.half_width, 'half_length': SEGMENT_HALF_LENGTH}
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path + '.json', 'r') as file:
+                meta = json.load(file)
+            if meta['key'] != self.get_cache_key():
+                return None
+            segments = np.load(self.cache_path + '.npy', mmap_mode='r')
+            grid = np.load(self.cache_path + '.grid.npy', mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return None
+        if segments.dtype != SEGMENT_DTYPE:
+            return None
+        return segments, grid, meta['grid_origin']
+
+    def save_cache(self, segments, grid, grid_origin):
+        # The .json is written last so a cache interrupted mid-write never matches
+        try:
+            for suffix, data in (('.npy', segments), ('.grid.npy', grid)):
+                with open(self.cache_path + suffix + '.tmp', 'wb') as file:
+                    np.save(file, data)
+                os.replace(self.cache_path + suffix + '.tmp', self.cache_path + suffix)
+            with open(self.cache_path + '.json.tmp', 'w') as file:
+                json.dump({'key': self.get_cache_key(), 'grid_origin': grid_origin}, file)
+            os.replace(self.cache_path + '.json.tmp', self.cache_path + '.json')
+        except OSError as e:
+            print(f'Could not write track cache - {e}')
+
+    def get_cell_segments(self, x, z):
+        cell_x = math.floor(x / self.cell_size) - self.grid_origin[0]
+        cell_z = math.floor(z / self.cell_size) - self.grid_origin[1]
+        if 0 <= cell_x < self.grid.shape[0] and 0 <= cell_z < self.grid.shape[1]:
+            return self.grid[cell_x, cell_z].tolist()
+        return []
+
+    def segment_contains(self, index, x, z):
+        origin_x, origin_z, across_x, across_z, along_x, along_z = self.frames[index]
+        x -= origin_x
+        z -= origin_z
+        return 0 <= x * across_x + z * across_z <= 1 and 0 <= x * along_x + z * along_z <= 1
+
+    def find_segment(self, pos, hint=None):
+        if hint is not None:
+            for offset in NEIGHBOUR_OFFSETS:
+                index = (hint + offset) % self.segment_count
+                if self.segment_contains(index, pos.x, pos.z):
+                    return index
+        for index in self.get_cell_segments(pos.x, pos.z):
+            if index < 0:
+                break
+            if self.segment_contains(index, pos.x, pos.z):
+                return index
+        return None
+
+    def contains(self, points, indices):
+        offsets = points - self.origins[indices]
+        across = np.einsum('...k,...k->...', offsets, self.axes[indices, 0])
+        along = np.einsum('...k,...k->...', offsets, self.axes[indices, 1])
+        return (across >= 0) & (across <= 1) & (along >= 0) & (along <= 1)
+
+    def classify(self, positions, hints=None):
+        # positions is an (M, 3) array of car positions, hints their last known segments or -1
+        points = np.asarray(positions, dtype='f4').reshape(-1, 3)[:, ::2]
+        segments = np.full(len(points), -1, dtype=np.int32)
+        if hints is not None:
+            hints = np.asarray(hints)
+            candidates = (hints[:, None] + np.array(NEIGHBOUR_OFFSETS)) % self.segment_count
+            inside = self.contains(points[:, None, :], candidates) & (hints >= 0)[:, None]
+            found = inside.any(axis=1)
+            segments[found] = candidates[found, inside[found].argmax(axis=1)]
+        missing = np.flatnonzero(segments < 0)
+        if len(missing):
+            # Only the segments listed in the grid cell of each point, like find_segment
+            cells = np.floor(points[missing] / self.cell_size).astype(np.int32) - self.grid_origin
+            on_grid = np.all((cells >= 0) & (cells < self.grid.shape[:2]), axis=1)
+            missing, cells = missing[on_grid], cells[on_grid]
+            candidates = self.grid[cells[:, 0], cells[:, 1]]
+            inside = self.contains(points[missing, None, :], np.maximum(candidates, 0)) & (candidates >= 0)
+            found = inside.any(axis=1)
+            segments[missing[found]] = candidates[found, inside[found].argmax(axis=1)]
+        return segments, segments >= 0
+
+
+class TrackCursor:
+    def __init__(self, track):
+        self.track = track
+        self.segment = None
+
+    def update(self, pos):
+        found = self.track.find_segment(pos, self.segment)
+        if found is not None:
+            self.segment = found
+        return found
+
+
+class LapTracker:
+    def __init__(self, track, laps=RACE_LAPS):
+        self.track = track
+        self.laps = laps
+        self.lap = 0
+        self.visited = set()
+        self.finished = False
+
+    def update(self, segment):
+        # Returns True on the update that completes a lap
+        if segment is None or segment < 0 or self.finished:
+            return False
+        self.visited.add(segment)
+        if segment != FINISH_SEGMENT or len(self.visited) < self.track.segment_count * LAP_COVERAGE:
+            return False
+        self.lap += 1
+        self.visited.clear()
+        self.finished = self.lap == self.laps
+        return True
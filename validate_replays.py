@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from replay import ReplayCatalogue, Replay, REPLAY_DIR
+from simulation import RaceSimulation, FleetSimulation
+from track import TrackPath
+
+# Recorded times are wall clock and include load hitches, so allow some slack
+DEFAULT_TOLERANCE = 2.5
+# The replays were recorded with a looser on-road test that let drivers cut corners about a unit wider than the road,
+# so they are checked against a wider track than the game uses
+REPLAY_HALF_WIDTH = 6
+
+track = None
+
+
+def init_worker(options_path):
+    global track
+    config.parse_options(options_path)
+    track = TrackPath(half_width=REPLAY_HALF_WIDTH)
+
+
+def simulate_replay(path):
+    replay = Replay.load(path)
+    simulation = RaceSimulation(track)
+    simulation.add_replay_car(replay)
+    return replay.finish_time, simulation.run()[0]
+
+
+def simulate_fleet(paths):
+    replays = [Replay.load(path) for path in paths]
+    simulation = FleetSimulation(track, replays)
+    return list(zip([replay.finish_time for replay in replays], simulation.run()))
+
+
+def validate(names, directory, tolerance, workers, options_path, fleet=False):
+    if not names:
+        print('No replays to check')
+        return 0
+    # Builds the track cache once before the workers start reading it
+    TrackPath(half_width=REPLAY_HALF_WIDTH)
+    paths = [os.path.join(directory, name) for name in names]
+    start = time.perf_counter()
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(options_path,)) as executor:
+        if fleet:
+            # One vectorized fleet per worker instead of one simulation per replay
+            size = -(-len(paths) // workers)
+            chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+            results = [result for chunk in executor.map(simulate_fleet, chunks) for result in chunk]
+        else:
+            results = list(executor.map(simulate_replay, paths, chunksize=max(1, len(paths) // 64)))
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for name, (recorded, simulated) in zip(names, results):
+        if simulated is None:
+            failed += 1
+            print(f'{name:<16} recorded {recorded:8.3f}  simulated      DNF')
+            continue
+        divergence = simulated - recorded
+        if abs(divergence) > tolerance:
+            failed += 1
+        print(f'{name:<16} recorded {recorded:8.3f}  simulated {simulated:8.3f}  divergence {divergence:+7.3f}'
+              f'{"  !" if abs(divergence) > tolerance else ""}')
+    print(f'{len(names)} replays checked in {elapsed:.2f}s, {failed} outside {tolerance}s')
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Re-simulate recorded replays and compare their finish times')
+    parser.add_argument('names', nargs='*', help='replay file names, all finished replays by default')
+    parser.add_argument('--dir', default=REPLAY_DIR)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='allowed divergence in seconds')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--options', default='options.txt')
+    parser.add_argument('--fleet', action='store_true', help='simulate each worker\'s replays as one vectorized fleet')
+    args = parser.parse_args()
+
+    names = args.names
+    if not names:
+        catalogue = ReplayCatalogue(args.dir)
+        names = sorted(name for place in range(1, 4) for name in catalogue.get_finished(place))
+    sys.exit(1 if validate(names, args.dir, args.tolerance, args.workers, args.options, args.fleet) else 0)
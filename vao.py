@@ -1,4 +1,5 @@
 import config
+from profiler import startup
 from vbo import VBO
 from shader_program import ShaderProgram
 
@@ -6,40 +7,68 @@ from shader_program import ShaderProgram
 class VAO:
     def __init__(self, ctx):
         self.ctx = ctx
-        self.vbo = VBO(ctx)
-        self.program = ShaderProgram(ctx)
+        with startup.phase('meshes'):
+            self.vbo = VBO(ctx)
+        with startup.phase('shaders'):
+            self.program = ShaderProgram(ctx)
         self.vaos = {}
-        base_vaos = ['cube', 'track', 'markings', 'rail', 'finish', 'tree', 'rock', 'podium']
-        for i in base_vaos:
-            self.add_vao(i, 'default')
+        # Vertex arrays of the coarser levels of detail, by the name of the full detail one
+        self.lod_vaos = {}
+        # Instanced vertex arrays of the car parts, full detail first, shadow ones by name + '_shadow'
+        self.instanced_vaos = {}
+        with startup.phase('vertex arrays'):
+            base_vaos = ['cube', 'track', 'markings', 'rail', 'finish', 'tree', 'rock', 'podium']
+            for i in base_vaos:
+                self.add_vao(i, 'default')
+                for chunk in self.vbo.chunks.get(i, []):
+                    self.add_vao(chunk, 'default')
 
-        for i, _ in config.global_variables['cars'].items():
-            self.get_car(i)
-        self.vaos.update(self.get_shadow_vaos())
+            for i, _ in config.global_variables['cars'].items():
+                self.get_car(i)
+            self.vaos.update(self.get_shadow_vaos())
 
-        self.add_vao('skybox', 'skybox')
+            self.add_vao('skybox', 'skybox')
 
     def get_shadow_vaos(self):
         shadow_vaos = {}
         for key, _ in self.vaos.items():
             shadow_vaos[key + '_shadow'] = self.get_vao(program=self.program.programs['shadow'], vbo=self.vbo.vbos[key])
+            self.lod_vaos[key + '_shadow'] = self.get_lod_vaos(program=self.program.programs['shadow'],
+                                                               vbo=self.vbo.vbos[key])
         return shadow_vaos
 
     def get_car(self, name):
         self.add_vao(name, 'default')
         self.add_vao(name + '_front', 'default_wheels')
         self.add_vao(name + '_back', 'default_wheels')
+        for part in (name, name + '_front', name + '_back'):
+            self.instanced_vaos[part] = self.get_instanced_vaos(self.program.programs['instanced'], part)
+            self.instanced_vaos[part + '_shadow'] = self.get_instanced_vaos(self.program.programs['shadow_instanced'],
+                                                                            part)
 
     def add_vao(self, name, shader, bonus=''):
         self.vaos[name] = self.get_vao(
             program=self.program.programs[shader],
             vbo=self.vbo.vbos[name + bonus]
         )
+        self.lod_vaos[name] = self.get_lod_vaos(program=self.program.programs[shader], vbo=self.vbo.vbos[name + bonus])
 
-    def get_vao(self, program, vbo):
-        vao = self.ctx.vertex_array(program, [(vbo.vbo, vbo.format, *vbo.attrib)], skip_errors=True)
+    def get_vao(self, program, vbo, ibo=None):
+        vao = self.ctx.vertex_array(program, [(vbo.vbo, vbo.format, *vbo.attrib)],
+                                    index_buffer=vbo.ibo if ibo is None else ibo, index_element_size=4,
+                                    skip_errors=True)
         return vao
 
+    def get_lod_vaos(self, program, vbo):
+        return [self.get_vao(program, vbo, ibo) for ibo in vbo.lod_ibos]
+
+    def get_instanced_vaos(self, program, name):
+        vbo = self.vbo.vbos[name]
+        return [self.ctx.vertex_array(program, [(vbo.vbo, vbo.format, *vbo.attrib),
+                                                (instance_vbo.vbo, instance_vbo.format, *instance_vbo.attrib)],
+                                      index_buffer=ibo, index_element_size=4, skip_errors=True)
+                for ibo, instance_vbo in zip([vbo.ibo] + vbo.lod_ibos, self.vbo.instance_vbos[name])]
+
     def destroy(self):
         self.vbo.destroy()
         self.program.destroy()
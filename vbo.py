@@ -1,13 +1,23 @@
 import numpy as np
-import pywavefront
 
 import config
+from assets import load_obj, index_vertices
+from profiler import startup
+
+# Cars of one model drawn by a single call, more than this are split over several
+MAX_INSTANCES = 16
+# A model matrix and a texture array layer per instance
+INSTANCE_SIZE = 17
 
 
 class VBO:
     def __init__(self, ctx):
         self.ctx = ctx
         self.vbos = {}
+        # Names of the chunk VBOs a chunked mesh is drawn with
+        self.chunks = {}
+        # Per instance data of the instanced car parts, one buffer per level of detail
+        self.instance_vbos = {}
         self.vbos['cube'] = CubeVBO(ctx)
         self.vbos['skybox'] = SkyBoxVBO(ctx)
         self.add_single_vvbo('podium','podium')
@@ -17,54 +27,92 @@ class VBO:
         self.get_world_vbos()
 
     def get_car_vbos(self, car_name):
-        objs = pywavefront.Wavefront(f'objects/{car_name}.obj', cache=True, parse=True)
-        self.add_vvbo('CarBody', car_name, objs)
-        self.add_zvvbo('FrontWheels', car_name + '_front', objs)
-        self.add_zvvbo('BackWheels', car_name + '_back', objs)
+        with startup.phase(f'objects/{car_name}.obj'):
+            meshes = load_obj(f'objects/{car_name}.obj')
+        self.add_vvbo('CarBody', car_name, meshes)
+        self.add_zvvbo('FrontWheels', car_name + '_front', meshes)
+        self.add_zvvbo('BackWheels', car_name + '_back', meshes)
+        for part in (car_name, car_name + '_front', car_name + '_back'):
+            self.instance_vbos[part] = [InstanceVBO(self.ctx) for _ in range(len(self.vbos[part].lod_ibos) + 1)]
 
     def get_world_vbos(self):
-        objs = pywavefront.Wavefront(f'objects/track.obj', cache=True, parse=True)
+        with startup.phase('objects/track.obj'):
+            meshes = load_obj('objects/track.obj')
         world_vvbos = {'Road': 'track', 'Markings': 'markings', 'Rail': 'rail', 'End': 'finish', 'Tree': 'tree',
                        'Rock': 'rock'}
         for k, i in world_vvbos.items():
-            self.add_vvbo(k, i, objs)
+            self.add_vvbo(k, i, meshes)
+            if meshes[k].chunks:
+                self.add_chunk_vbos(k, i, meshes)
 
     def add_single_vvbo(self, vbo_name, obj_name):
-        obj = pywavefront.Wavefront(f'objects/{obj_name}.obj', cache=True, parse=True)
-        vertex_data = obj.materials.popitem()[1].vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        self.vbos[vbo_name] = VertexedVBO(self.ctx, vertex_data)
-
-    def add_vvbo(self, mat_name, vbo_name, obj):
-        vertex_data = obj.materials[mat_name].vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        self.vbos[vbo_name] = VertexedVBO(self.ctx, vertex_data)
-
-    def add_zvvbo(self, mat_name, vbo_name, obj):
-        vertex_data = obj.materials[mat_name].vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        self.vbos[vbo_name] = ZCenteredVertexedVBO(self.ctx, vertex_data)
+        with startup.phase(f'objects/{obj_name}.obj'):
+            meshes = load_obj(f'objects/{obj_name}.obj')
+        # Single mesh objects use their last material, like pywavefront's popitem did
+        mesh = list(meshes.values())[-1]
+        self.vbos[vbo_name] = VertexedVBO(self.ctx, mesh.vertices, mesh.indices, mesh.lods[1:], mesh.bounds)
+
+    def add_vvbo(self, mat_name, vbo_name, meshes):
+        mesh = meshes[mat_name]
+        self.vbos[vbo_name] = VertexedVBO(self.ctx, mesh.vertices, mesh.indices, mesh.lods[1:], mesh.bounds)
+
+    def add_zvvbo(self, mat_name, vbo_name, meshes):
+        mesh = meshes[mat_name]
+        self.vbos[vbo_name] = ZCenteredVertexedVBO(self.ctx, mesh.vertices, mesh.indices, mesh.pivot, mesh.lods[1:],
+                                                   mesh.bounds)
+
+    def add_chunk_vbos(self, mat_name, vbo_name, meshes):
+        self.chunks[vbo_name] = []
+        for i, chunk in enumerate(meshes[mat_name].chunks):
+            self.vbos[f'{vbo_name}_{i}'] = ChunkVBO(self.ctx, self.vbos[vbo_name], chunk.indices, chunk.lods[1:],
+                                                    chunk.bounds)
+            self.chunks[vbo_name].append(f'{vbo_name}_{i}')
 
     def destroy(self):
         [vbo.destroy() for vbo in self.vbos.values()]
+        [vbo.destroy() for vbos in self.instance_vbos.values() for vbo in vbos]
 
 
 class BaseVBO:
     def __init__(self, ctx):
         self.ctx = ctx
         self.vbo = self.get_vbo()
+        # Index buffer of meshes drawn with shared vertices, None for plain triangle lists
+        self.ibo = self.get_ibo()
+        # Index buffers of the coarser levels of detail, nearest first
+        self.lod_ibos = [self.ctx.buffer(index_data) for index_data in self.get_lod_index_data()]
+        # Bounding sphere in model space as ((x, y, z), radius), None when unknown
+        self.bounds = self.get_bounds()
         self.format: str = None
         self.attrib: list = None
 
     def get_vertex_data(self): ...
 
+    def get_index_data(self):
+        return None
+
+    def get_lod_index_data(self):
+        return []
+
+    def get_bounds(self):
+        return None
+
     def get_vbo(self):
         vertex_data = self.get_vertex_data()
         vbo = self.ctx.buffer(vertex_data)
         return vbo
 
+    def get_ibo(self):
+        index_data = self.get_index_data()
+        if index_data is None:
+            return None
+        return self.ctx.buffer(index_data)
+
     def destroy(self):
         self.vbo.release()
+        if self.ibo is not None:
+            self.ibo.release()
+        [ibo.release() for ibo in self.lod_ibos]
 
 
 class RectangleVBO(BaseVBO):
@@ -98,9 +146,28 @@ class RectangleVBO(BaseVBO):
         self.vbo.release()
 
 
+class InstanceVBO:
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.format = '16f 1f/i'
+        self.attrib = ['in_model', 'in_layer']
+        self.vbo = self.ctx.buffer(reserve=MAX_INSTANCES * INSTANCE_SIZE * 4, dynamic=True)
+
+    def write(self, instance_data):
+        # Rewritten several times a frame, orphaning keeps the driver from waiting on the previous draw
+        self.vbo.orphan()
+        self.vbo.write(instance_data)
+
+    def destroy(self):
+        self.vbo.release()
+
+
 class VertexedVBO(BaseVBO):
-    def __init__(self, app, vertex_data):
+    def __init__(self, app, vertex_data, index_data=None, lods=(), bounds=None):
         self.vertex_data = vertex_data
+        self.index_data = index_data
+        self.lods = lods
+        self.mesh_bounds = bounds
         super().__init__(app)
         self.format = '2f 3f 3f'
         self.attrib = ['in_texCoord_0', 'in_normal', 'in_position']
@@ -108,46 +175,65 @@ class VertexedVBO(BaseVBO):
     def get_vertex_data(self):
         return self.vertex_data
 
+    def get_index_data(self):
+        return self.index_data
+
+    def get_lod_index_data(self):
+        return self.lods
+
+    def get_bounds(self):
+        return self.mesh_bounds
+
+
+class ChunkVBO(VertexedVBO):
+    def __init__(self, app, parent, index_data, lods=(), bounds=None):
+        # Part of a chunked mesh, drawn from the vertex buffer of the whole mesh
+        self.parent = parent
+        super().__init__(app, None, index_data, lods, bounds)
+
+    def get_vbo(self):
+        return self.parent.vbo
+
+    def destroy(self):
+        self.ibo.release()
+        [ibo.release() for ibo in self.lod_ibos]
+
 
 class ZCenteredVertexedVBO(BaseVBO):
-    def __init__(self, app, vertex_data):
+    def __init__(self, app, vertex_data, index_data=None, pivot=None, lods=(), bounds=None):
+        # Centre of the mesh on y and z, the axle the wheel turns around, found from the vertices when not given
+        self.pivot = pivot
         self.offset_z = None
         self.offset_y = None
         self.vertex_data = vertex_data
+        self.index_data = index_data
+        self.lods = lods
+        self.mesh_bounds = bounds
         super().__init__(app)
         self.format = '2f 3f 3f'
         self.attrib = ['in_texCoord_0', 'in_normal', 'in_position']
 
     def get_vertex_data(self):
-        min = self.vertex_data[7]
-        max = self.vertex_data[7]
-        for i in range(16, len(self.vertex_data), 8):
-            if min > self.vertex_data[i - 1]:
-                min = self.vertex_data[i - 1]
-            elif max < self.vertex_data[i - 1]:
-                max = self.vertex_data[i - 1]
-        offset = (max + min) / 2
-        for i in range(8, len(self.vertex_data) + 1, 8):
-            self.vertex_data[i - 1] -= offset
-        self.offset_z = offset
-
-        min = self.vertex_data[6]
-        max = self.vertex_data[6]
-        for i in range(16, len(self.vertex_data), 8):
-            if min > self.vertex_data[i - 2]:
-                min = self.vertex_data[i - 2]
-            elif max < self.vertex_data[i - 2]:
-                max = self.vertex_data[i - 2]
-        offset = (max + min) / 2
-        for i in range(8, len(self.vertex_data) + 1, 8):
-            self.vertex_data[i - 2] -= offset
-        self.offset_y = offset
-
+        positions = self.vertex_data.reshape(-1, 8)[:, 6:8]
+        if self.pivot is None:
+            self.pivot = ((positions.min(axis=0) + positions.max(axis=0)) / 2).tolist()
+        self.offset_y, self.offset_z = self.pivot
+        positions -= np.array(self.pivot, dtype='f4')
         return self.vertex_data
 
+    def get_index_data(self):
+        return self.index_data
+
+    def get_lod_index_data(self):
+        return self.lods
+
+    def get_bounds(self):
+        return self.mesh_bounds
+
 
 class CubeVBO(BaseVBO):
     def __init__(self, ctx):
+        self.vertex_data, self.index_data = index_vertices(self.get_triangle_data())
         super().__init__(ctx)
         self.format = '2f 3f 3f'
         self.attrib = ['in_texCoord_0', 'in_normal', 'in_position']
@@ -158,6 +244,15 @@ class CubeVBO(BaseVBO):
         return np.array(data, dtype='f4')
 
     def get_vertex_data(self):
+        return self.vertex_data
+
+    def get_index_data(self):
+        return self.index_data
+
+    def get_bounds(self):
+        return (0, 0, 0), 3 ** 0.5
+
+    def get_triangle_data(self):
         vertices = [(-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1),
                     (-1, 1, -1), (-1, -1, -1), (1, -1, -1), (1, 1, -1)]
 